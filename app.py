@@ -24,14 +24,21 @@ st.set_page_config(
 @st.cache_resource
 def initialize_chatbot():
     
+    # Model and index load on a background thread so the page renders at once.
     try:
         chatbot = FirstAidChatbot()
-        chatbot.initialize('data/Assignment-Data-Base.xlsx')
+        chatbot.start_warmup('data/Assignment-Data-Base.xlsx')
         return chatbot
     except Exception as e:
         st.error(f"Failed to initialize chatbot: {str(e)}")
         return None
 
+def wait_for_chatbot(chatbot):
+    
+    if not chatbot.ready.is_set():
+        with st.spinner("Loading the embedding model and knowledge base..."):
+            chatbot.wait_until_ready()
+
 def main():
     st.title("🏥 RAG-Powered First-Aid Chatbot")
     st.subheader("Diabetes, Cardiac & Renal Emergencies")
@@ -54,9 +61,17 @@ def main():
         st.error("Please check your API keys in the .env file")
         st.stop()
     
-    st.sidebar.success("✅ System initialized successfully!")
-    st.sidebar.info("📊 60 medical sentences loaded")
-    st.sidebar.info("🌐 Web search enabled")
+    if chatbot.startup_error is not None:
+        st.sidebar.error(f"Initialization failed: {chatbot.startup_error}")
+    elif chatbot.ready.is_set():
+        st.sidebar.success("✅ System initialized successfully!")
+        st.sidebar.info("📊 60 medical sentences loaded")
+        st.sidebar.info("🌐 Web search enabled")
+        with st.sidebar.expander("Startup Timings"):
+            for phase, duration_ms in chatbot.startup_timings.items():
+                st.markdown(f"**{phase}:** {duration_ms:.0f} ms")
+    else:
+        st.sidebar.info("⏳ Loading model and knowledge base in the background...")
     
     if mode == "Interactive Chat":
         interactive_chat(chatbot)
@@ -102,51 +117,63 @@ def interactive_chat(chatbot):
     
     if st.button("🚨 Get Emergency First-Aid Guidance", type="primary"):
         if user_input.strip():
-            with st.spinner(" Analyzing symptoms and searching medical knowledge..."):
-                start_time = time.time()
+            st.markdown("### Medical Response")
+            response_placeholder = st.empty()
+            
+            try:
+                wait_for_chatbot(chatbot)
+                
+                # Render chunks as they arrive; the disclaimer is the first chunk.
+                stream = chatbot.generate_response_stream(user_input)
+                streamed_text = ""
+                for chunk in stream:
+                    streamed_text += chunk
+                    response_placeholder.markdown(streamed_text + "▌")
+                
+                result = stream.result
+                response_placeholder.markdown(result['response'])
+                
+                
+                col1, col2, col3, col4, col5 = st.columns(5)
+                
+                with col1:
+                    st.metric(" Response Time", f"{result['response_time']:.2f}s")
+                
+                with col2:
+                    first_token = result['time_to_first_token']
+                    st.metric(" First Token", f"{first_token:.2f}s" if first_token is not None else "-")
+                
+                with col3:
+                    st.metric(" Condition", result['condition_type'] or "General")
                 
-                try:
-                    result = chatbot.generate_response(user_input)
-                    end_time = time.time()
-                    result['response_time'] = end_time - start_time
-                    
-                    
-                    st.markdown("### Medical Response")
-                    st.markdown(result['response'])
-                    
-                    
-                    col1, col2, col3, col4 = st.columns(4)
-                    
-                    with col1:
-                        st.metric(" Response Time", f"{result['response_time']:.2f}s")
-                    
-                    with col2:
-                        st.metric(" Condition", result['condition_type'] or "General")
-                    
-                    with col3:
-                        st.metric("🚨 Urgency", result['urgency_level'].title())
-                    
-                    with col4:
-                        st.metric(" Sources", len(result['sources']))
-                    
-                    
-                    with st.expander(" View Source Details"):
-                        for i, source in enumerate(result['sources'], 1):
-                            if source['search_type'] == 'local_semantic':
-                                st.markdown(f"**[{i}] Local Knowledge (Sentence #{source['sentence']['id']}):**")
-                                st.text(source['sentence']['content'])
-                                st.markdown(f"*Score: {source['score']:.3f}, Category: {source['sentence']['category']}*")
-                            elif source['search_type'] == 'web_search':
-                                st.markdown(f"**[{i}] Web Source:** {source['title']}")
-                                st.text(source['snippet'][:200] + "...")
-                                st.markdown(f"*Link: {source['link']}*")
-                            elif source['search_type'] == 'keyword_search':
-                                st.markdown(f"**[{i}] Keyword Match (Sentence #{source['sentence']['id']}):**")
-                                st.text(source['sentence']['content'])
-                            st.markdown("---")
-                    
-                except Exception as e:
-                    st.error(f"Error generating response: {str(e)}")
+                with col4:
+                    st.metric("🚨 Urgency", result['urgency_level'].title())
+                
+                with col5:
+                    st.metric(" Sources", len(result['sources']))
+                
+                
+                with st.expander(" View Source Details"):
+                    for i, source in enumerate(result['sources'], 1):
+                        if source['search_type'] == 'local_semantic':
+                            st.markdown(f"**[{i}] Local Knowledge (Sentence #{source['sentence']['id']}):**")
+                            st.text(source['sentence']['content'])
+                            st.markdown(f"*Score: {source['score']:.3f}, Category: {source['sentence']['category']}*")
+                        elif source['search_type'] == 'web_search':
+                            st.markdown(f"**[{i}] Web Source:** {source['title']}")
+                            st.text(source['snippet'][:200] + "...")
+                            st.markdown(f"*Link: {source['link']}*")
+                        elif source['search_type'] == 'keyword_search':
+                            st.markdown(f"**[{i}] Keyword Match (Sentence #{source['sentence']['id']}):**")
+                            st.text(source['sentence']['content'])
+                        st.markdown("---")
+                
+                with st.expander(" Stage Timings"):
+                    for stage, duration_ms in result.get('timings', {}).items():
+                        st.markdown(f"**{stage}:** {duration_ms:.1f} ms")
+                
+            except Exception as e:
+                st.error(f"Error generating response: {str(e)}")
         else:
             st.warning("Please enter your symptoms or medical question.")
 
@@ -157,44 +184,35 @@ def test_all_queries(chatbot):
     st.markdown("Testing the chatbot against all sample queries from Assignment.pdf to verify it passes at least 8/10 with correct triage + relevant citations.")
     
     if st.button(" Run All 10 Tests", type="primary"):
+        wait_for_chatbot(chatbot)
         progress_bar = st.progress(0)
+        status = st.empty()
         results = []
         
-        for i, query in enumerate(TEST_QUERIES):
-            st.markdown(f"**Testing Query {i+1}/10:** {query[:100]}...")
+        # Queries run concurrently; each result is reported as soon as it completes.
+        for completed, (i, result) in enumerate(chatbot.generate_responses(TEST_QUERIES), start=1):
+            result['query_number'] = i + 1
+            results.append(result)
             
-            try:
-                with st.spinner(f"Processing query {i+1}/10..."):
-                    start_time = time.time()
-                    result = chatbot.generate_response(query)
-                    end_time = time.time()
-                    
-                    result['response_time'] = end_time - start_time
-                    result['query_number'] = i + 1
-                    results.append(result)
-                    
-                    
-                    has_condition = '**condition:**' in result['response'].lower()
-                    has_actions = '**immediate actions:**' in result['response'].lower()
-                    has_sources = '[' in result['response'] and ']' in result['response']
-                    
-                    if has_condition and has_actions and has_sources:
-                        st.success(f"✅ Query {i+1} PASSED - {result['response_time']:.2f}s")
-                    else:
-                        st.warning(f"⚠️ Query {i+1} needs review")
-                    
-                    with st.expander(f"Preview Response {i+1}"):
-                        st.markdown(result['response'][:400] + "...")
+            if 'error' in result:
+                st.error(f"❌ Query {i+1} failed: {result['error']}")
+            else:
+                has_condition = '**condition:**' in result['response'].lower()
+                has_actions = '**immediate actions:**' in result['response'].lower()
+                has_sources = '[' in result['response'] and ']' in result['response']
                 
-            except Exception as e:
-                st.error(f"❌ Query {i+1} failed: {str(e)}")
-                results.append({
-                    'query': query, 
-                    'response': f'Error: {str(e)}',
-                    'query_number': i + 1
-                })
+                if has_condition and has_actions and has_sources:
+                    st.success(f"✅ Query {i+1} PASSED - {result['response_time']:.2f}s")
+                else:
+                    st.warning(f"⚠️ Query {i+1} needs review")
+                
+                with st.expander(f"Preview Response {i+1}: {TEST_QUERIES[i][:80]}..."):
+                    st.markdown(result['response'][:400] + "...")
             
-            progress_bar.progress((i + 1) / len(TEST_QUERIES))
+            status.markdown(f"**Completed {completed}/{len(TEST_QUERIES)} queries**")
+            progress_bar.progress(completed / len(TEST_QUERIES))
+        
+        results.sort(key=lambda r: r['query_number'])
         
         
         st.markdown("### 📊 Test Results Summary")
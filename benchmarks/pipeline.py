@@ -0,0 +1,385 @@
+"""
+Offline end-to-end latency benchmark for FirstAidChatbot.
+
+Gemini and Serper are replaced by deterministic local stand-ins with a
+configurable simulated latency, so runs need no network and no API quota.
+The pipeline is driven over TEST_QUERIES against the real knowledge base and
+synthetic corpora of increasing size, and every stage is timed in place.
+
+    python -m benchmarks.pipeline --sizes 60 1000 10000 --output benchmark.json
+    python -m benchmarks.pipeline --update-baseline
+
+Exits non-zero when a stage's p95 latency regresses past the stored baseline.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.chatbot import FirstAidChatbot, TEST_QUERIES
+from src.corpus import MedicalCorpus, load_or_build_corpus
+from src.keyword_index import tokenize
+
+
+DEFAULT_SOURCE = 'data/Assignment-Data-Base.xlsx'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+STAGES = ('triage', 'local_search', 'keyword_search', 'web_search', 'retrieval', 'llm', 'end_to_end')
+
+STAND_IN_ANSWER = [
+    "⚠️ This information is for educational purposes only and is not a substitute for professional medical advice.\n\n",
+    "**Condition:** Suspected emergency based on the reported symptoms [1]\n",
+    "**Immediate Actions:**\n- Call emergency services [1]\n- Keep the person still and monitored [2]\n",
+    "**Medications:** As directed by the sources [1]\n",
+]
+
+
+class StandInEncoder:
+    """Hashed bag-of-words encoder with the SentenceTransformer interface used by MedicalEmbeddings"""
+
+    def __init__(self, model_name=None, dimension: int = 384):
+        self.dimension = dimension
+
+    def _encode_one(self, text: str) -> np.ndarray:
+
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in tokenize(text):
+            vector[zlib.crc32(token.encode()) % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+
+        if isinstance(texts, str):
+            return self._encode_one(texts)
+        return np.array([self._encode_one(text) for text in texts], dtype=np.float32).reshape(-1, self.dimension)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StandInGenerativeModel:
+    """Replays a fixed cited answer after `latency` seconds, streamed over `chunk_latency` gaps"""
+
+    def __init__(self, latency: float = 0.5, chunk_latency: float = 0.0, chunks: List[str] = None):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.chunks = chunks or STAND_IN_ANSWER
+
+    def _stream(self):
+
+        for chunk in self.chunks:
+            time.sleep(self.chunk_latency)
+            yield _Chunk(chunk)
+
+    def generate_content(self, prompt, stream=False):
+
+        time.sleep(self.latency)
+        if stream:
+            return self._stream()
+        time.sleep(self.chunk_latency * len(self.chunks))
+        return _Chunk(''.join(self.chunks))
+
+
+class StandInSerper:
+    """Local HTTP endpoint answering Serper requests with canned results after `latency` seconds"""
+
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self.requests = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stand_in.requests += 1
+                time.sleep(stand_in.latency)
+                payload = json.dumps({
+                    'organic': [
+                        {'title': f"Result {rank} for {body['q'][:40]}",
+                         'snippet': 'Seek emergency care and follow first aid guidance.',
+                         'link': f"https://example.org/{rank}"}
+                        for rank in range(1, body.get('num', 3) + 1)
+                    ]
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/search"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def synthetic_corpus(base: MedicalCorpus, size: int) -> MedicalCorpus:
+    """Grows the knowledge base to `size` rows by cycling its sentences with distinct variant tags"""
+
+    if size <= len(base):
+        return base[:size]
+
+    rows = np.arange(size)
+    source = rows % len(base)
+    variants = rows // len(base)
+    contents = np.array([
+        str(base.contents[s]) if v == 0 else f"{base.contents[s]} (variant {v})"
+        for s, v in zip(source, variants)
+    ], dtype=str)
+    return MedicalCorpus(rows.astype(np.int64) + 1, contents, base.categories[source])
+
+
+def summarize(samples: List[float]) -> Dict:
+    """Latency percentiles plus throughput, i.e. calls per second of time spent in the stage"""
+
+    values = np.asarray(samples, dtype=np.float64)
+    return {
+        'count': int(len(values)),
+        'mean_ms': float(values.mean() * 1000),
+        'p50_ms': float(np.percentile(values, 50) * 1000),
+        'p95_ms': float(np.percentile(values, 95) * 1000),
+        'p99_ms': float(np.percentile(values, 99) * 1000),
+        'throughput_per_second': float(len(values) / values.sum()) if values.sum() else 0.0,
+    }
+
+
+def _instrument(owner, method_name: str, samples: List[float]):
+    """Replaces owner.method_name with a wrapper that records each call's duration"""
+
+    original = getattr(owner, method_name)
+    lock = threading.Lock()
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.append(elapsed)
+
+    setattr(owner, method_name, timed)
+
+
+@contextlib.contextmanager
+def _benchmark_environment(serper_url: str, workdir: str, quantization: str = None):
+
+    overrides = {
+        'GOOGLE_API_KEY': os.getenv('GOOGLE_API_KEY') or 'benchmark',
+        'SERPER_API_KEY': os.getenv('SERPER_API_KEY') or 'benchmark',
+        'SERPER_BASE_URL': serper_url,
+        'VECTOR_INDEX_BACKEND': 'numpy',
+        'VECTOR_INDEX_PATH': '',
+        'VECTOR_INDEX_QUANTIZATION': quantization or '',
+        'EMBEDDING_CACHE_DIR': os.path.join(workdir, 'embeddings'),
+        # Caches would turn repeated queries into lookups, so every stage runs cold.
+        'RESPONSE_CACHE_TTL_SECONDS': '0',
+        'WEB_CACHE_TTL_SECONDS': '0',
+        'SEMANTIC_CACHE_THRESHOLD': '',
+        # Adaptive web search would make the measured path depend on the corpus; always query Serper.
+        'WEB_SKIP_LOCAL_SCORE': '',
+        'WEB_SEARCH_HEDGE_SECONDS': '',
+    }
+    saved = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def build_chatbot(corpus: MedicalCorpus, llm_latency: float, encoder: str = 'stand-in') -> FirstAidChatbot:
+
+    chatbot = FirstAidChatbot()
+    chatbot.model = StandInGenerativeModel(latency=llm_latency)
+
+    embeddings = chatbot.retrieval.embeddings
+    if encoder == 'stand-in':
+        embeddings.model = StandInEncoder()
+    embeddings.initialize_index()
+    embeddings.sentences = corpus
+    chatbot.retrieval.build_keyword_index()
+    embeddings.create_embeddings(show_progress=False)
+    return chatbot
+
+
+def benchmark_corpus(chatbot: FirstAidChatbot, queries: List[str], repeats: int) -> Dict:
+
+    samples = {stage: [] for stage in STAGES}
+    retrieval = chatbot.retrieval
+    _instrument(chatbot.triage, 'triage', samples['triage'])
+    _instrument(retrieval, 'perform_local_search', samples['local_search'])
+    _instrument(retrieval, 'perform_keyword_search', samples['keyword_search'])
+    _instrument(retrieval, 'perform_web_search', samples['web_search'])
+    _instrument(retrieval, 'hybrid_search', samples['retrieval'])
+    _instrument(chatbot, '_call_gemini', samples['llm'])
+
+    for _ in range(repeats):
+        for query in queries:
+            chatbot.triage._memo.clear()
+            retrieval.embeddings.query_cache.clear()
+            query_start = time.perf_counter()
+            chatbot.generate_response(query)
+            samples['end_to_end'].append(time.perf_counter() - query_start)
+
+    return {stage: summarize(values) for stage, values in samples.items() if values}
+
+
+def run_benchmark(sizes: List[int], queries: List[str] = None, repeats: int = 3, llm_latency: float = 0.5,
+                  web_latency: float = 0.3, source_path: str = DEFAULT_SOURCE, encoder: str = 'stand-in',
+                  quantization: str = None) -> Dict:
+
+    queries = list(queries or TEST_QUERIES)
+    base = load_or_build_corpus(source_path)
+    serper = StandInSerper(latency=web_latency)
+    corpora = {}
+    index_reports = {}
+
+    try:
+        with tempfile.TemporaryDirectory() as workdir, _benchmark_environment(serper.url, workdir, quantization):
+            for size in sizes:
+                chatbot = build_chatbot(synthetic_corpus(base, size), llm_latency, encoder)
+                corpora[str(size)] = benchmark_corpus(chatbot, queries, repeats)
+                index_reports[str(size)] = chatbot.retrieval.embeddings.evaluate_index(queries, top_k=3)
+                chatbot.retrieval.executor.shutdown(wait=False)
+    finally:
+        serper.close()
+
+    return {
+        'config': {
+            'sizes': list(sizes),
+            'queries': len(queries),
+            'repeats': repeats,
+            'llm_latency': llm_latency,
+            'web_latency': web_latency,
+            'encoder': encoder,
+            'quantization': quantization,
+        },
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'corpora': corpora,
+        'index': index_reports,
+    }
+
+
+def find_regressions(results: Dict, baseline: Dict, tolerance: float = 0.25, slack_ms: float = 5.0) -> List[str]:
+    """
+    Compares p95 latency per corpus size and stage against the baseline.
+    A stage regresses when it is slower than baseline * (1 + tolerance) plus
+    slack_ms; the absolute slack keeps sub-millisecond stages from flapping.
+    """
+
+    regressions = []
+    for size, stages in results['corpora'].items():
+        for stage, summary in stages.items():
+            reference = baseline.get('corpora', {}).get(size, {}).get(stage)
+            if reference is None:
+                continue
+            limit = reference['p95_ms'] * (1 + tolerance) + slack_ms
+            if summary['p95_ms'] > limit:
+                regressions.append(
+                    f"{stage} @ {size} sentences: p95 {summary['p95_ms']:.1f}ms > limit {limit:.1f}ms "
+                    f"(baseline {reference['p95_ms']:.1f}ms)"
+                )
+    return regressions
+
+
+def format_table(results: Dict) -> str:
+
+    lines = [f"{'size':>8} {'stage':<15} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9}"]
+    for size, stages in results['corpora'].items():
+        for stage, summary in stages.items():
+            lines.append(
+                f"{size:>8} {stage:<15} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} "
+                f"{summary['p99_ms']:>9.2f} {summary['throughput_per_second']:>9.2f}"
+            )
+    return "\n".join(lines)
+
+
+def _write_json(path: str, data: Dict):
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Offline latency benchmark with stand-in Gemini and Serper backends.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[60, 1000, 10000],
+                        help="Corpus sizes to benchmark; sizes above the knowledge base are synthetic")
+    parser.add_argument('--repeats', type=int, default=3, help="Passes over TEST_QUERIES per corpus size")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Simulated Gemini latency in seconds")
+    parser.add_argument('--web-latency', type=float, default=0.3, help="Simulated Serper latency in seconds")
+    parser.add_argument('--encoder', choices=['stand-in', 'model'], default='stand-in',
+                        help="Use the hashed stand-in encoder or the real SentenceTransformer")
+    parser.add_argument('--quantization', choices=['int8', 'binary'], default=None,
+                        help="Store corpus vectors quantized and report recall@3 against exact search")
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help="Knowledge base spreadsheet")
+    parser.add_argument('--output', default='benchmark-results.json', help="Where to write the JSON results")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Stored baseline to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative p95 slowdown")
+    parser.add_argument('--update-baseline', action='store_true', help="Overwrite the baseline with this run")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sizes, repeats=args.repeats, llm_latency=args.llm_latency,
+                            web_latency=args.web_latency, source_path=args.source, encoder=args.encoder,
+                            quantization=args.quantization)
+    print(format_table(results))
+    for size, report in results['index'].items():
+        print(f"{size:>8} index recall@{report['top_k']} {report['recall_at_k']:.3f} "
+              f"({report['vectors_bytes']} float32 bytes, {report['codes_bytes']} code bytes)")
+    _write_json(args.output, results)
+    print(f"Wrote results to {args.output}")
+
+    if args.update_baseline:
+        _write_json(args.baseline, results)
+        print(f"Updated baseline {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('config') != results['config']:
+        print("Note: baseline was recorded with a different configuration; only matching sizes are compared")
+    regressions = find_regressions(results, baseline, tolerance=args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
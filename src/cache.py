@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+def content_hash(text: str) -> str:
+
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def normalize_query(text: str) -> str:
+
+    return ' '.join(text.lower().split())
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU mapping with hit/miss counters.
+    With a ttl (seconds) entries also expire that long after they were stored.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        if maxsize < 1:
+            raise ValueError("LRU cache size must be at least 1")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[1] is not None and entry[1] <= time.monotonic():
+                del self._data[key]
+                entry = _MISSING
+
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value store for JSON-serialisable values with a TTL.
+    It survives restarts and can be shared by several worker processes.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+        )
+        self._conn.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+
+        with self._lock:
+            row = self._conn.execute('SELECT value, expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] <= time.time():
+                self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at)
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional disk tier; disk hits are promoted to memory."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str, default: Any = None) -> Any:
+
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        if self.disk is not None:
+            value = self.disk.get(key, _MISSING)
+            if value is not _MISSING:
+                self.memory.put(key, value)
+                return value
+
+        return default
+
+    def put(self, key: str, value: Any):
+
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def stats(self) -> Dict:
+
+        memory = self.memory.stats()
+        disk_hits = self.disk.hits if self.disk is not None else 0
+        lookups = memory['hits'] + memory['misses']
+        hits = memory['hits'] + disk_hits
+        return {
+            'memory_hits': memory['hits'],
+            'disk_hits': disk_hits,
+            'misses': lookups - hits,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'memory_size': memory['size'],
+        }
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding store keyed on (model name, sentence content hash).
+    One .npz file is kept per model so vectors from different encoders never mix.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str):
+        self.model_name = model_name
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.path = os.path.join(cache_dir, f"{safe_name}.npz")
+
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._vectors = None
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+        self._load()
+
+    def _load(self):
+
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data['model_name']) != self.model_name:
+                    return
+                keys = data['keys']
+                self._vectors = np.ascontiguousarray(data['vectors'], dtype=np.float32)
+        except Exception as e:
+            print(f"Ignoring unreadable embedding cache {self.path}: {e}")
+            return
+
+        self._rows = {str(key): row for row, key in enumerate(keys)}
+
+    def __len__(self):
+        return len(self._rows) + len(self._pending)
+
+    def get_many(self, hashes: Sequence[str]) -> List[Optional[np.ndarray]]:
+
+        results = []
+        with self._lock:
+            for key in hashes:
+                if key in self._pending:
+                    results.append(self._pending[key])
+                elif key in self._rows:
+                    results.append(self._vectors[self._rows[key]])
+                else:
+                    results.append(None)
+
+            found = sum(1 for vector in results if vector is not None)
+            self.hits += found
+            self.misses += len(results) - found
+
+        return results
+
+    def put_many(self, hashes: Sequence[str], vectors: np.ndarray):
+
+        with self._lock:
+            for key, vector in zip(hashes, vectors):
+                if key not in self._rows:
+                    self._pending[key] = np.asarray(vector, dtype=np.float32)
+
+    def save(self):
+
+        with self._lock:
+            if not self._pending:
+                return
+
+            keys = list(self._rows) + list(self._pending)
+            new_vectors = np.stack(list(self._pending.values()))
+            vectors = new_vectors if self._vectors is None else np.vstack([self._vectors, new_vectors])
+
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(tmp_path, model_name=np.array(self.model_name), keys=np.array(keys), vectors=vectors)
+            os.replace(tmp_path, self.path)
+
+            self._vectors = vectors
+            self._rows = {key: row for row, key in enumerate(keys)}
+            self._pending = {}
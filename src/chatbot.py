@@ -1,8 +1,22 @@
-import google.generativeai as genai
+import hashlib
+import json
 import os
-from typing import Dict, List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .cache import DiskCache, LRUCache, TieredCache
+from .context_builder import BuiltContext, ContextBuilder, estimate_tokens
+from .rate_limit import RateLimiter
 from .retrieval import HybridRetrieval
-from .triage import MedicalTriage
+from .semantic_cache import SemanticResponseCache
+from .tracing import Trace, TraceLog, span
+
+
+# Bump whenever system_prompt or build_prompt changes so cached answers
+# generated from an older prompt are never served.
+SYSTEM_PROMPT_VERSION = '1'
+
 
 class FirstAidChatbot:
     """
@@ -11,15 +25,58 @@ class FirstAidChatbot:
     """
     
     def __init__(self):
-        genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
         if not os.getenv('GOOGLE_API_KEY'):
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
         
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        # The Gemini client is created on first use; see the model property.
+        self.model_name = 'gemini-2.0-flash'
+        self._model = None
+        self._model_lock = threading.Lock()
+        
+        # Start-up state: filled in by initialize(), possibly on a background thread.
+        self.ready = threading.Event()
+        self.startup_error = None
+        self.startup_timings = {}
+        self._warmup_thread = None
+        
+        # Exact-match cache of generated answers; a TTL of 0 disables it.
+        cache_ttl = float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '3600'))
+        cache_path = os.getenv('RESPONSE_CACHE_PATH') or None
+        self.response_cache = None
+        if cache_ttl > 0:
+            self.response_cache = TieredCache(
+                LRUCache(256, ttl=cache_ttl),
+                DiskCache(cache_path, ttl=cache_ttl) if cache_path else None
+            )
+        
+        # Near-duplicate query cache; only enabled when a similarity threshold is configured.
+        semantic_threshold = os.getenv('SEMANTIC_CACHE_THRESHOLD')
+        self.semantic_cache = None
+        if semantic_threshold:
+            self.semantic_cache = SemanticResponseCache(
+                threshold=float(semantic_threshold),
+                ttl=cache_ttl or None
+            )
+        
+        # Gemini calls from every thread share one token bucket; 0 disables the limit.
+        requests_per_minute = float(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '0'))
+        self.rate_limiter = RateLimiter(requests_per_minute / 60.0) if requests_per_minute > 0 else None
+        self.max_concurrency = int(os.getenv('BATCH_MAX_CONCURRENCY', '4'))
+        
+        # Upper bound on the retrieved context placed in each prompt, in estimated tokens.
+        self.context_builder = ContextBuilder(
+            token_budget=int(os.getenv('CONTEXT_TOKEN_BUDGET', '600')),
+            max_snippet_tokens=int(os.getenv('CONTEXT_SNIPPET_TOKENS', '120')),
+            duplicate_threshold=float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', '0.8')),
+        )
+        
+        # Optional JSONL file receiving the per-stage timings of every request.
+        trace_log_path = os.getenv('TRACE_LOG_PATH')
+        self.trace_log = TraceLog(trace_log_path) if trace_log_path else None
         
        
         self.retrieval = HybridRetrieval()
-        self.triage = MedicalTriage()
+        self.triage = self.retrieval.triage
         
         
         self.disclaimer = "⚠️ *This information is for educational purposes only and is not a substitute for professional medical advice.*"
@@ -48,55 +105,201 @@ Sources: [Citation numbers in square brackets]
 
 Be precise, actionable, and safety-focused. For life-threatening situations, always prioritize calling emergency services."""
 
+    @property
+    def model(self):
+        
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
+    
     def initialize(self, file_path='data/Assignment-Data-Base.xlsx'):
         
-        self.retrieval.initialize(file_path)
+        trace = Trace()
+        try:
+            self.retrieval.initialize(file_path, trace=trace)
+            with trace.span('gemini_client'):
+                self.model
+        except Exception as e:
+            self.startup_error = e
+            raise
+        finally:
+            self.startup_timings = trace.timings()
+            self.startup_timings['total'] = round(trace.elapsed() * 1000, 3)
+        self.ready.set()
+    
+    def start_warmup(self, file_path='data/Assignment-Data-Base.xlsx') -> threading.Thread:
+        """
+        Runs initialize() on a background thread so callers (the UI, a health
+        check) can come up before the model and index are loaded. Use
+        wait_until_ready() before answering queries.
+        """
+        
+        def run():
+            try:
+                self.initialize(file_path)
+            except Exception as e:
+                print(f"Background initialization failed: {e}")
+        
+        if self._warmup_thread is None:
+            self._warmup_thread = threading.Thread(target=run, name='chatbot-warmup', daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+    
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        
+        # Re-raises a failed background initialization instead of waiting forever.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.ready.wait(0.05):
+            if self.startup_error is not None:
+                raise RuntimeError(f"Chatbot initialization failed: {self.startup_error}") from self.startup_error
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
+    
+    def build_context(self, search_results: List[Dict]) -> BuiltContext:
+        
+        # Citation numbers in the context follow the order of BuiltContext.sources.
+        return self.context_builder.build(search_results)
     
     def prepare_context(self, search_results: List[Dict]) -> str:
         
-        context_parts = []
+        return self.build_context(search_results).text
+    
+    def _context_stats(self, query: str, built: BuiltContext) -> Dict:
+        
+        stats = built.stats()
+        stats['prompt_tokens'] = estimate_tokens(self.build_prompt(query, built.text))
+        return stats
+    
+    def _semantic_lookup(self, query: str, triage_result):
+        
+        if self.semantic_cache is None:
+            return None, None
+        
+        query_vector = self.retrieval.embeddings.encode_query(query)
+        hit = self.semantic_cache.lookup(query_vector, triage_result, query)
+        if hit is None:
+            return None, query_vector
+        
+        response, similarity = hit
+        result = dict(response)
+        result['query'] = query
+        result['cache'] = 'semantic'
+        result['semantic_similarity'] = similarity
+        return result, query_vector
+    
+    def _finish_trace(self, result: Dict, trace: Trace) -> Dict:
         
-        for i, result in enumerate(search_results, 1):
-            if result['search_type'] == 'local_semantic':
-                sentence = result['sentence']
-                context_parts.append(f"[{i}] Local Knowledge (ID {sentence['id']}): {sentence['content']}")
-            elif result['search_type'] == 'web_search':
-                context_parts.append(f"[{i}] Web Source: {result['title']}: {result['snippet']}")
-            elif result['search_type'] == 'keyword_search':
-                sentence = result['sentence']
-                context_parts.append(f"[{i}] Keyword Match (ID {sentence['id']}): {sentence['content']}")
+        result['timings'] = trace.timings()
+        result['timings']['total'] = round(trace.elapsed() * 1000, 3)
+        result['spans'] = trace.spans()
         
-        return "\n\n".join(context_parts)
+        if self.trace_log is not None:
+            # Queries can hold personal health details, so the log only keeps a hash.
+            self.trace_log.write({
+                'timestamp': trace.started_at,
+                'query_hash': hashlib.sha256(result['query'].encode('utf-8')).hexdigest()[:16],
+                'condition_type': result.get('condition_type'),
+                'cache': result.get('cache'),
+                'timings': result['timings'],
+                'spans': result['spans'],
+            })
+        return result
     
     def generate_response(self, query: str) -> Dict:
         
+        trace = Trace()
+        
+        # Triage runs once and is shared by retrieval and generation.
+        with trace.span('triage'):
+            triage_result = self.triage.triage(query)
         
+        with span(trace if self.semantic_cache is not None else None, 'semantic_cache'):
+            cached_result, query_vector = self._semantic_lookup(query, triage_result)
+        if cached_result is not None:
+            return self._finish_trace(cached_result, trace)
         
-        search_results, condition_type = self.retrieval.hybrid_search(query)
+        retrieval_path = {}
+        with trace.span('retrieval'):
+            search_results, condition_type = self.retrieval.hybrid_search(
+                query, triage_result=triage_result, trace=trace, path=retrieval_path
+            )
         
         
-        urgency = self.triage.assess_urgency(query)
+        urgency = triage_result.urgency
         
         
-        context = self.prepare_context(search_results)
+        with trace.span('context_building'):
+            built = self.build_context(search_results)
+            context = built.text
         
         
-        response_text = self.call_gemini(query, context)
+        with trace.span('llm'):
+            response_text, generated = self._call_gemini(query, context)
         
        
-        return {
+        result = {
             'query': query,
             'condition_type': condition_type,
             'urgency_level': urgency,
+            'triage': triage_result.as_dict(),
             'response': response_text,
-            'sources': search_results,
+            'sources': list(built.sources),
+            'context': self._context_stats(query, built),
+            'retrieval_path': retrieval_path,
             'disclaimer': self.disclaimer
         }
+        
+        if generated and query_vector is not None:
+            self.semantic_cache.store(query_vector, triage_result, query, dict(result))
+        
+        return self._finish_trace(result, trace)
     
-    def call_gemini(self, query: str, context: str) -> str:
-       
+    def _generate_timed(self, query: str) -> Dict:
+        
+        start_time = time.perf_counter()
+        try:
+            result = self.generate_response(query)
+        except Exception as e:
+            result = {'query': query, 'response': f'Error: {str(e)}', 'error': str(e)}
+        result['response_time'] = time.perf_counter() - start_time
+        return result
+    
+    def generate_responses(self, queries: Iterable[str], max_concurrency: int = None) -> Iterator[Tuple[int, Dict]]:
+        """
+        Answers a batch of queries in parallel and yields (index, result) pairs
+        as each one completes, so callers can report progress live. At most
+        max_concurrency queries are in flight, and Gemini calls are still
+        paced by the shared rate limiter. A query that raises yields a result
+        with an 'error' key instead of aborting the batch.
+        """
+        
+        queries = list(queries)
+        max_concurrency = max(1, max_concurrency or self.max_concurrency)
+        if not queries:
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=min(max_concurrency, len(queries)),
+                                      thread_name_prefix='batch')
+        try:
+            futures = {executor.submit(self._generate_timed, query): i for i, query in enumerate(queries)}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Stops queued queries if the caller abandons the generator early.
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def build_prompt(self, query: str, context: str) -> str:
         
-        user_prompt = f"""
+        return f"""
 {self.system_prompt}
 
 User Query: "{query}"
@@ -106,8 +309,51 @@ Available Medical Knowledge:
 
 Please analyze the symptoms, identify the most likely condition, and provide immediate first-aid guidance with proper citations following the exact format specified.
 """
+    
+    def _fallback_message(self, error: Exception) -> str:
+        
+        return f"I apologize, but I'm unable to process your query at the moment. Please consult a healthcare professional immediately for medical emergencies. Error: {str(error)}"
+    
+    def _response_cache_key(self, query: str, context: str) -> str:
+        
+        material = json.dumps([self.model_name, SYSTEM_PROMPT_VERSION, query, context], ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    def _cached_response(self, query: str, context: str) -> Optional[str]:
+        
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(self._response_cache_key(query, context))
+    
+    def _store_response(self, query: str, context: str, response_text: str):
+        
+        if self.response_cache is not None:
+            self.response_cache.put(self._response_cache_key(query, context), response_text)
+    
+    def cache_stats(self) -> Dict:
+        
+        return {
+            'response_cache': self.response_cache.stats() if self.response_cache is not None else {},
+            'web_cache': self.retrieval.web_search.cache_stats(),
+        }
+    
+    def call_gemini(self, query: str, context: str) -> str:
+       
+        
+        return self._call_gemini(query, context)[0]
+    
+    def _call_gemini(self, query: str, context: str):
+        
+        # Returns (text, generated); generated is False for the fallback message.
+        cached = self._cached_response(query, context)
+        if cached is not None:
+            return cached, True
+        
+        user_prompt = self.build_prompt(query, context)
 
         try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
             response = self.model.generate_content(user_prompt)
             generated_text = response.text.strip()
             
@@ -115,10 +361,148 @@ Please analyze the symptoms, identify the most likely condition, and provide imm
             if not generated_text.startswith("⚠️"):
                 generated_text = f"{self.disclaimer}\n\n{generated_text}"
             
-            return generated_text
+            self._store_response(query, context, generated_text)
+            return generated_text, True
+            
+        except Exception as e:
+            return f"{self.disclaimer}\n\n{self._fallback_message(e)}", False
+    
+    def _strip_model_disclaimer(self, chunks: Iterable[str]) -> Iterator[str]:
+        
+        # Callers emit the disclaimer up front, so a disclaimer line the model
+        # writes itself is dropped from the stream.
+        marker = "⚠️"
+        buffer = ""
+        passthrough = False
+        
+        for text in chunks:
+            if passthrough:
+                yield text
+                continue
             
+            buffer += text
+            head = buffer.lstrip()
+            if len(head) < len(marker) and marker.startswith(head):
+                continue
+            if not head.startswith(marker):
+                passthrough = True
+                yield head
+            elif "\n" in head:
+                passthrough = True
+                body = head.split("\n", 1)[1].lstrip()
+                if body:
+                    yield body
+        
+        if not passthrough and buffer.strip() and not buffer.lstrip().startswith(marker):
+            yield buffer.lstrip()
+    
+    def call_gemini_stream(self, query: str, context: str) -> Iterator[str]:
+        
+        # Yields the answer body only, without the disclaimer.
+        return self._call_gemini_stream(query, context, {})
+    
+    def _call_gemini_stream(self, query: str, context: str, outcome: Dict) -> Iterator[str]:
+        
+        # outcome['generated'] is set to False when the fallback message was streamed.
+        outcome['generated'] = True
+        cached = self._cached_response(query, context)
+        if cached is not None:
+            yield from self._strip_model_disclaimer([cached])
+            return
+        
+        body_parts = []
+        try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            response = self.model.generate_content(self.build_prompt(query, context), stream=True)
+            for text in self._strip_model_disclaimer(chunk.text for chunk in response):
+                body_parts.append(text)
+                yield text
         except Exception as e:
-            return f"{self.disclaimer}\n\nI apologize, but I'm unable to process your query at the moment. Please consult a healthcare professional immediately for medical emergencies. Error: {str(e)}"
+            outcome['generated'] = False
+            yield self._fallback_message(e)
+            return
+        
+        self._store_response(query, context, f"{self.disclaimer}\n\n{''.join(body_parts).strip()}")
+    
+    def generate_response_stream(self, query: str) -> 'ResponseStream':
+        
+        return ResponseStream(self, query)
+    
+    def _stream_response(self, query: str, stream: 'ResponseStream') -> Iterator[str]:
+        
+        trace = Trace()
+        
+        # The disclaimer goes out before retrieval even starts.
+        yield f"{self.disclaimer}\n\n"
+        
+        with trace.span('triage'):
+            triage_result = self.triage.triage(query)
+        
+        with span(trace if self.semantic_cache is not None else None, 'semantic_cache'):
+            cached_result, query_vector = self._semantic_lookup(query, triage_result)
+        if cached_result is not None:
+            # The stored answer may open with the model's own disclaimer wording.
+            body = ''.join(self._strip_model_disclaimer([cached_result['response']])).strip()
+            time_to_first_token = trace.elapsed()
+            yield body
+            cached_result['time_to_first_token'] = time_to_first_token
+            cached_result['response_time'] = trace.elapsed()
+            stream.result = self._finish_trace(cached_result, trace)
+            return
+        
+        retrieval_path = {}
+        with trace.span('retrieval'):
+            search_results, condition_type = self.retrieval.hybrid_search(
+                query, triage_result=triage_result, trace=trace, path=retrieval_path
+            )
+        with trace.span('context_building'):
+            built = self.build_context(search_results)
+            context = built.text
+        
+        body_parts = []
+        outcome = {}
+        time_to_first_token = None
+        with trace.span('llm'):
+            for chunk in self._call_gemini_stream(query, context, outcome):
+                if time_to_first_token is None:
+                    time_to_first_token = trace.elapsed()
+                body_parts.append(chunk)
+                yield chunk
+        
+        result = {
+            'query': query,
+            'condition_type': condition_type,
+            'urgency_level': triage_result.urgency,
+            'triage': triage_result.as_dict(),
+            'response': f"{self.disclaimer}\n\n{''.join(body_parts).strip()}",
+            'sources': list(built.sources),
+            'context': self._context_stats(query, built),
+            'retrieval_path': retrieval_path,
+            'disclaimer': self.disclaimer
+        }
+        
+        if outcome['generated'] and query_vector is not None:
+            self.semantic_cache.store(query_vector, triage_result, query, dict(result))
+        
+        result['time_to_first_token'] = time_to_first_token
+        result['response_time'] = trace.elapsed()
+        stream.result = self._finish_trace(result, trace)
+
+
+class ResponseStream:
+    """
+    Iterates over response text chunks as they are generated.
+    Once exhausted, .result holds the same dict generate_response returns,
+    plus time_to_first_token and response_time in seconds.
+    """
+    
+    def __init__(self, chatbot: FirstAidChatbot, query: str):
+        self.result = None
+        self._chunks = chatbot._stream_response(query, self)
+    
+    def __iter__(self):
+        return self._chunks
 
 
 TEST_QUERIES = [
@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .keyword_index import tokenize
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token for English text), no tokenizer round-trip"""
+
+    return (len(text) + 3) // 4
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens, preferring a sentence end, then a word boundary"""
+
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    limit = max(0, max_tokens * 4 - 1)
+    cut = text[:limit]
+    sentence_end = max(cut.rfind('. '), cut.rfind('! '), cut.rfind('? '))
+    if sentence_end >= limit // 2:
+        return cut[:sentence_end + 1]
+    word_end = cut.rfind(' ')
+    if word_end > 0:
+        cut = cut[:word_end]
+    return cut.rstrip(' ,;:') + '…'
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass(frozen=True)
+class BuiltContext:
+    """Prompt context plus the sources it cites, numbered to match the [n] markers"""
+
+    text: str
+    sources: Tuple[Dict, ...]
+    tokens_used: int
+    token_budget: int
+    trimmed: int
+    collapsed: int
+    dropped: int
+
+    def stats(self) -> Dict:
+
+        return {
+            'tokens_used': self.tokens_used,
+            'token_budget': self.token_budget,
+            'sources_used': len(self.sources),
+            'trimmed': self.trimmed,
+            'collapsed': self.collapsed,
+            'dropped': self.dropped,
+        }
+
+
+class ContextBuilder:
+    """
+    Turns ranked search results into prompt context under a token budget.
+    Results are taken in rank order; each snippet is capped at
+    max_snippet_tokens, results whose text nearly repeats an earlier one are
+    collapsed into it, and whatever no longer fits the budget is left out.
+    """
+
+    def __init__(self, token_budget: int = 600, max_snippet_tokens: int = 120,
+                 duplicate_threshold: float = 0.8, min_entry_tokens: int = 24):
+        self.token_budget = token_budget
+        self.max_snippet_tokens = max_snippet_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_entry_tokens = min_entry_tokens
+
+    @staticmethod
+    def _parts(result: Dict) -> Optional[Tuple[str, str]]:
+
+        search_type = result.get('search_type')
+        if search_type == 'local_semantic':
+            sentence = result['sentence']
+            return f"Local Knowledge (ID {sentence['id']})", sentence['content']
+        if search_type == 'web_search':
+            return f"Web Source: {result['title']}", result['snippet']
+        if search_type == 'keyword_search':
+            sentence = result['sentence']
+            return f"Keyword Match (ID {sentence['id']})", sentence['content']
+        return None
+
+    def build(self, search_results: List[Dict]) -> BuiltContext:
+
+        entries, sources, seen = [], [], []
+        tokens_used = trimmed = collapsed = dropped = 0
+
+        for result in search_results:
+            parts = self._parts(result)
+            if parts is None:
+                continue
+            label, body = parts
+
+            terms = frozenset(tokenize(body))
+            if any(_jaccard(terms, earlier) >= self.duplicate_threshold for earlier in seen):
+                collapsed += 1
+                continue
+
+            separator_tokens = 1 if entries else 0
+            header = f"[{len(entries) + 1}] {label}: "
+            remaining = self.token_budget - tokens_used - separator_tokens - estimate_tokens(header)
+            snippet_cap = min(self.max_snippet_tokens, remaining)
+            if snippet_cap < min(self.min_entry_tokens, estimate_tokens(body)):
+                dropped += 1
+                continue
+
+            text = trim_to_tokens(body, snippet_cap)
+            trimmed += int(text != body)
+
+            entry = header + text
+            entries.append(entry)
+            sources.append(result)
+            seen.append(terms)
+            tokens_used += separator_tokens + estimate_tokens(entry)
+
+        return BuiltContext(
+            text="\n\n".join(entries),
+            sources=tuple(sources),
+            tokens_used=tokens_used,
+            token_budget=self.token_budget,
+            trimmed=trimmed,
+            collapsed=collapsed,
+            dropped=dropped,
+        )
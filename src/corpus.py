@@ -0,0 +1,153 @@
+import argparse
+import os
+import re
+from collections.abc import Sequence
+
+import numpy as np
+
+from .vocabulary import CATEGORY_KEYWORDS, category_tag, medical_matcher
+
+
+CORPUS_SUFFIX = '.corpus.npz'
+
+
+class MedicalCorpus(Sequence):
+    """
+    Columnar view of the knowledge base: parallel id, content and category arrays.
+    Rows are materialised as dicts only when accessed.
+    """
+
+    def __init__(self, ids: np.ndarray, contents: np.ndarray, categories: np.ndarray):
+        self.ids = ids
+        self.contents = contents
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return MedicalCorpus(self.ids[index], self.contents[index], self.categories[index])
+
+        return {
+            'id': int(self.ids[index]),
+            'content': str(self.contents[index]),
+            'category': str(self.categories[index])
+        }
+
+
+def categorize_sentence(content: str) -> str:
+
+    matches = medical_matcher().match(content.lower())
+    for category in CATEGORY_KEYWORDS:
+        if category_tag(category) in matches:
+            return category
+    return 'general'
+
+
+def categorize_contents(contents) -> np.ndarray:
+
+    import pandas as pd
+
+    lowered = pd.Series(contents, dtype=object).str.lower()
+    conditions = [
+        lowered.str.contains('|'.join(re.escape(keyword) for keyword in keywords), regex=True).to_numpy(dtype=bool)
+        for keywords in CATEGORY_KEYWORDS.values()
+    ]
+    return np.select(conditions, list(CATEGORY_KEYWORDS), default='general')
+
+
+def compiled_corpus_path(source_path: str) -> str:
+
+    return os.path.splitext(source_path)[0] + CORPUS_SUFFIX
+
+
+def _read_spreadsheet(source_path: str) -> MedicalCorpus:
+
+    import pandas as pd
+
+    df = pd.read_excel(source_path, sheet_name='Database')
+    ids = df['#'].to_numpy(dtype=np.int64)
+    contents = df['Sentence'].astype(str).to_numpy(dtype=str)
+    categories = categorize_contents(contents)
+    return MedicalCorpus(ids, contents, categories.astype(str))
+
+
+def _write_corpus(corpus: MedicalCorpus, source_path: str, output_path: str):
+
+    stat = os.stat(source_path)
+    tmp_path = f"{output_path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        ids=corpus.ids,
+        contents=corpus.contents,
+        categories=corpus.categories,
+        source_size=np.int64(stat.st_size),
+        source_mtime_ns=np.int64(stat.st_mtime_ns),
+    )
+    os.replace(tmp_path, output_path)
+
+
+def build_corpus(source_path: str, output_path: str = None) -> MedicalCorpus:
+
+    corpus = _read_spreadsheet(source_path)
+    _write_corpus(corpus, source_path, output_path or compiled_corpus_path(source_path))
+    return corpus
+
+
+def load_corpus(path: str) -> MedicalCorpus:
+
+    with np.load(path, allow_pickle=False) as data:
+        return MedicalCorpus(data['ids'], data['contents'], data['categories'])
+
+
+def _load_if_fresh(compiled_path: str, source_path: str):
+
+    if not os.path.exists(compiled_path):
+        return None
+
+    try:
+        stat = os.stat(source_path)
+        with np.load(compiled_path, allow_pickle=False) as data:
+            if (int(data['source_size']) != stat.st_size
+                    or int(data['source_mtime_ns']) != stat.st_mtime_ns):
+                return None
+            return MedicalCorpus(data['ids'], data['contents'], data['categories'])
+    except Exception as e:
+        print(f"Ignoring unreadable compiled corpus {compiled_path}: {e}")
+        return None
+
+
+def load_or_build_corpus(source_path: str) -> MedicalCorpus:
+
+    if source_path.endswith('.npz'):
+        return load_corpus(source_path)
+
+    compiled_path = compiled_corpus_path(source_path)
+    corpus = _load_if_fresh(compiled_path, source_path)
+    if corpus is not None:
+        return corpus
+
+    print(f"Compiling corpus {source_path} -> {compiled_path}")
+    corpus = _read_spreadsheet(source_path)
+    try:
+        _write_corpus(corpus, source_path, compiled_path)
+    except OSError as e:
+        # A read-only data directory (a container image, say) only costs the
+        # spreadsheet parse on every start; it must not stop the start itself.
+        print(f"Could not save compiled corpus {compiled_path}: {e}; using it in memory")
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile the medical knowledge base spreadsheet into a columnar .npz corpus')
+    parser.add_argument('source', nargs='?', default='data/Assignment-Data-Base.xlsx')
+    parser.add_argument('-o', '--output', default=None)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.source, args.output)
+    print(f"Compiled {len(corpus)} sentences to {args.output or compiled_corpus_path(args.source)}")
+
+
+if __name__ == '__main__':
+    main()
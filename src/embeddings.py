@@ -1,116 +1,311 @@
-import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
 import os
+import sys
+import threading
+import time
+from .cache import EmbeddingCache, LRUCache, content_hash, normalize_query
+from .corpus import categorize_sentence, load_or_build_corpus
+from .tracing import span
+from .vector_index import QUANTIZATION_TYPES, NumpyVectorIndex, QdrantVectorIndex
+
+
+def __getattr__(name):
+    
+    # sentence_transformers (and torch with it) and qdrant_client are imported
+    # on first use so importing this module stays cheap at app start-up.
+    if name == 'SentenceTransformer':
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer
+    if name == 'QdrantClient':
+        from qdrant_client import QdrantClient
+        return QdrantClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _module_attr(name):
+    
+    # Goes through the module namespace so tests can substitute these classes.
+    module = sys.modules[__name__]
+    return getattr(module, name)
+
+
+def _iter_chunks(items, size):
+    
+    if size < 1:
+        raise ValueError("Chunk size must be at least 1")
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 
 class MedicalEmbeddings:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name='all-MiniLM-L6-v2', cache_dir=None, index_backend='qdrant', index_path=None,
+                 query_cache_size=1024, index_quantization=None, rescore_multiplier=None):
+        if index_backend not in ('qdrant', 'numpy'):
+            raise ValueError(f"Unknown vector index backend: {index_backend}")
+        if index_quantization is not None and index_quantization not in QUANTIZATION_TYPES:
+            raise ValueError(f"Unknown vector index quantization: {index_quantization}")
+        
+        self.model_name = model_name
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.embedding_cache = EmbeddingCache(cache_dir, model_name) if cache_dir else None
+        self.query_cache = LRUCache(query_cache_size) if query_cache_size else None
         self.collection_name = "medical_sentences"
+        self.index_backend = index_backend
+        self.index_path = index_path
+        self.index_quantization = index_quantization
+        self.rescore_multiplier = rescore_multiplier
         self.client = None
+        self.index = None
         self.sentences = []
+        self.last_ingestion_stats = None
+        
+    @property
+    def model(self):
+        
+        # Loaded on first use; concurrent first callers share one load.
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = _module_attr('SentenceTransformer')(self.model_name)
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
+    
+    def warm_up(self):
         
+        # Loads the model and runs one throwaway encode so the first real query
+        # does not pay for lazy initialisation inside the encoder.
+        self.model.encode(["warm-up query"], show_progress_bar=False)
+    
     def initialize_qdrant(self, url=None):
        
+        QdrantClient = _module_attr('QdrantClient')
         if url is None:
             self.client = QdrantClient(":memory:")
         else:
             self.client = QdrantClient(url=url)
-
         
-    def load_medical_sentences(self, file_path='data/Assignment-Data-Base.xlsx'):
+        self.index = QdrantVectorIndex(self.client, self.collection_name, quantization=self.index_quantization,
+                                       rescore_multiplier=self.rescore_multiplier)
+    
+    def initialize_index(self, url=None):
         
-        df = pd.read_excel(file_path, sheet_name='Database')
-        self.sentences = []
+        if self.index_backend == 'numpy':
+            self.index = NumpyVectorIndex(path=self.index_path, quantization=self.index_quantization,
+                                          rescore_multiplier=self.rescore_multiplier)
+        else:
+            self.initialize_qdrant(url)
         
-        for _, row in df.iterrows():
-            self.sentences.append({
-                'id': int(row['#']),
-                'content': str(row['Sentence']),
-                'category': self._categorize_sentence(str(row['Sentence']))
-            })
+    def load_medical_sentences(self, file_path='data/Assignment-Data-Base.xlsx'):
         
+        # Reuses the compiled columnar corpus next to the spreadsheet and only
+        # re-parses the Excel file when it has changed.
+        self.sentences = load_or_build_corpus(file_path)
         return self.sentences
     
     def _categorize_sentence(self, content):
         
-        content_lower = content.lower()
-        
-        diabetes_keywords = ['diabetes', 'glucose', 'insulin', 'hypoglycaemia', 'hyperglycaemic', 'ketoacidosis', 'hba1c', 'metformin']
-        cardiac_keywords = ['chest pain', 'heart', 'cardiac', 'angina', 'myocardial', 'infarction', 'defibrillation', 'cpr']
-        renal_keywords = ['kidney', 'renal', 'creatinine', 'dialysis', 'aki', 'ckd', 'potassium', 'nephro']
-        
-        if any(keyword in content_lower for keyword in diabetes_keywords):
-            return 'diabetes'
-        elif any(keyword in content_lower for keyword in cardiac_keywords):
-            return 'cardiac'
-        elif any(keyword in content_lower for keyword in renal_keywords):
-            return 'renal'
-        else:
-            return 'general'
+        return categorize_sentence(content)
     
     def create_collection(self):
         
-        try:
-            self.client.delete_collection(self.collection_name)
-        except:
-            pass
-        
-        self.client.create_collection(
-            collection_name=self.collection_name,
-            vectors_config=VectorParams(
-                size=self.model.get_sentence_embedding_dimension(),
-                distance=Distance.COSINE,
-            ),
-        )
+        self.index.recreate(self.model.get_sentence_embedding_dimension())
     
-    def create_embeddings(self):
+    def create_embeddings(self, batch_size=64, upsert_chunk_size=256, show_progress=True):
         
         if not self.sentences:
             raise ValueError("No sentences loaded. Call load_medical_sentences first.")
         
         self.create_collection()
         
-        points = []
-        for sentence in self.sentences:
-            vector = self.model.encode(sentence['content']).tolist()
-            point = PointStruct(
-                id=sentence['id'],
-                vector=vector,
-                payload={
-                    'content': sentence['content'],
-                    'category': sentence['category'],
-                    'id': sentence['id']
-                }
+        start_time = time.perf_counter()
+        processed, cache_hits = self._embed_and_upsert(self.sentences, batch_size, upsert_chunk_size, show_progress)
+        
+        self.index.flush()
+        if self.embedding_cache is not None:
+            self.embedding_cache.save()
+        
+        elapsed = time.perf_counter() - start_time
+        self.last_ingestion_stats = {
+            'sentences': processed,
+            'cache_hits': cache_hits,
+            'seconds': elapsed,
+            'sentences_per_second': processed / elapsed if elapsed > 0 else 0.0,
+        }
+        
+        print(f"Successfully created embeddings for {processed} medical sentences")
+        return processed
+    
+    def sync_embeddings(self, batch_size=64, upsert_chunk_size=256, show_progress=True):
+        
+        # Diffs the loaded sentences against what the index already holds, by
+        # id and content hash, so only new or edited sentences are embedded and
+        # upserted and only removed ones are deleted. An index saved before
+        # hashes were stored is rebuilt once.
+        if not self.sentences:
+            raise ValueError("No sentences loaded. Call load_medical_sentences first.")
+        
+        start_time = time.perf_counter()
+        dimension = self.model.get_sentence_embedding_dimension()
+        kept = self.index.ensure(dimension)
+        stored = self.index.stored_hashes() if kept else {}
+        if None in stored.values():
+            self.index.recreate(dimension)
+            kept, stored = False, {}
+        
+        changed = [
+            sentence for sentence in self.sentences
+            if stored.get(sentence['id']) != content_hash(sentence['content'])
+        ]
+        removed = stored.keys() - {sentence['id'] for sentence in self.sentences}
+        added = sum(1 for sentence in changed if sentence['id'] not in stored)
+        
+        self.index.delete(sorted(removed))
+        processed, cache_hits = self._embed_and_upsert(changed, batch_size, upsert_chunk_size, show_progress)
+        
+        # An unchanged index is left alone, so processes sharing a saved index
+        # can all sync against it without rewriting its files.
+        if changed or removed or not kept:
+            self.index.flush()
+        if self.embedding_cache is not None and changed:
+            self.embedding_cache.save()
+        
+        elapsed = time.perf_counter() - start_time
+        self.last_ingestion_stats = {
+            'sentences': len(self.sentences),
+            'added': added,
+            'updated': len(changed) - added,
+            'deleted': len(removed),
+            'unchanged': len(self.sentences) - len(changed),
+            'cache_hits': cache_hits,
+            'seconds': elapsed,
+            'sentences_per_second': processed / elapsed if elapsed > 0 else 0.0,
+        }
+        
+        print(f"Synced embeddings: {added} added, {len(changed) - added} updated, "
+              f"{len(removed)} deleted, {len(self.sentences) - len(changed)} unchanged")
+        return processed
+    
+    def _embed_and_upsert(self, sentences, batch_size, upsert_chunk_size, show_progress):
+        
+        total = len(sentences)
+        processed = 0
+        cache_hits = 0
+        start_time = time.perf_counter()
+        
+        # Encode and upsert one bounded chunk at a time so memory stays flat
+        # regardless of corpus size.
+        for chunk in _iter_chunks(sentences, upsert_chunk_size):
+            vectors, hits = self._encode_chunk(chunk, batch_size)
+            cache_hits += hits
+            
+            self.index.upsert(
+                [sentence['id'] for sentence in chunk],
+                vectors,
+                [
+                    {
+                        'content': sentence['content'],
+                        'category': sentence['category'],
+                        'id': sentence['id'],
+                        'content_hash': content_hash(sentence['content'])
+                    }
+                    for sentence in chunk
+                ]
             )
-            points.append(point)
+            
+            processed += len(chunk)
+            if show_progress:
+                elapsed = time.perf_counter() - start_time
+                rate = processed / elapsed if elapsed > 0 else float('inf')
+                print(f"Embedded {processed}/{total} sentences ({rate:.1f} sentences/sec)")
+        
+        return processed, cache_hits
+    
+    def _encode_chunk(self, chunk, batch_size):
         
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=points
-        )
+        contents = [sentence['content'] for sentence in chunk]
+        if self.embedding_cache is None:
+            return self.model.encode(contents, batch_size=batch_size, show_progress_bar=False), 0
+        
+        hashes = [content_hash(content) for content in contents]
+        cached = self.embedding_cache.get_many(hashes)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        
+        if missing:
+            encoded = self.model.encode(
+                [contents[i] for i in missing],
+                batch_size=batch_size,
+                show_progress_bar=False,
+            )
+            self.embedding_cache.put_many([hashes[i] for i in missing], encoded)
+            for i, vector in zip(missing, encoded):
+                cached[i] = vector
+        
+        return np.stack(cached), len(chunk) - len(missing)
+    
+    def encode_queries(self, queries, batch_size=64):
+        
+        # Repeated queries share one cache entry regardless of case and spacing;
+        # the default MiniLM tokenizer is uncased, so the vector is unchanged.
+        normalized = [normalize_query(query) for query in queries]
+        if self.query_cache is None:
+            return np.asarray(self.model.encode(normalized, batch_size=batch_size, show_progress_bar=False))
+        
+        vectors = [self.query_cache.get(text) for text in normalized]
+        missing = list(dict.fromkeys(text for text, vector in zip(normalized, vectors) if vector is None))
+        
+        if missing:
+            encoded = self.model.encode(missing, batch_size=batch_size, show_progress_bar=False)
+            fresh = dict(zip(missing, encoded))
+            for text, vector in fresh.items():
+                self.query_cache.put(text, vector)
+            vectors = [fresh[text] if vector is None else vector for text, vector in zip(normalized, vectors)]
+        
+        return np.stack(vectors)
+    
+    def encode_query(self, query):
+        
+        return self.encode_queries([query])[0]
+    
+    def evaluate_index(self, queries, top_k=3):
+        """Recall@k of the configured index against exact search, plus its memory footprint when known"""
+        
+        report = {
+            'quantization': self.index_quantization,
+            'top_k': top_k,
+            'recall_at_k': self.index.recall_at_k(self.encode_queries(queries), top_k),
+        }
+        if hasattr(self.index, 'memory_footprint'):
+            report.update(self.index.memory_footprint())
+        return report
+    
+    def search_similar(self, query, top_k=3, category=None, trace=None):
         
-        print(f"Successfully created embeddings for {len(points)} medical sentences")
-        return len(points)
+        return self.search_similar_many([query], top_k, category, trace=trace)[0]
     
-    def search_similar(self, query, top_k=3):
+    def search_similar_many(self, queries, top_k=3, category=None, batch_size=64, trace=None):
         
-        query_vector = self.model.encode(query).tolist()
+        if not queries:
+            return []
         
-        search_result = self.client.search(
-            collection_name=self.collection_name,
-            query_vector=query_vector,
-            limit=top_k
-        )
+        # One encoder pass and one vector search for the whole batch.
+        with span(trace, 'query_encoding'):
+            query_vectors = self.encode_queries(queries, batch_size=batch_size)
+        with span(trace, 'vector_search'):
+            batches = self.index.search(query_vectors, top_k, category=category)
         
-        results = []
-        for i, hit in enumerate(search_result):
-            results.append({
-                'sentence': hit.payload,
-                'score': float(hit.score),
-                'rank': i + 1
-            })
+        all_results = []
+        for hits in batches:
+            results = []
+            for i, (payload, score) in enumerate(hits):
+                results.append({
+                    'sentence': payload,
+                    'score': score,
+                    'rank': i + 1
+                })
+            all_results.append(results)
         
-        return results
+        return all_results
@@ -0,0 +1,77 @@
+import heapq
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+SEARCH_TYPES = {
+    'local': 'local_semantic',
+    'web': 'web_search',
+    'keyword': 'keyword_search',
+}
+
+
+def result_key(result: Dict) -> Tuple[str, str]:
+    """Identity of a retrieved item across sources: its sentence ID, or its normalised URL for web hits"""
+
+    sentence = result.get('sentence')
+    if sentence is not None:
+        return ('sentence', str(sentence['id']))
+
+    link = result.get('link') or ''
+    if link:
+        parts = urlsplit(link.strip())
+        return ('url', f"{parts.netloc.lower()}{parts.path.rstrip('/')}?{parts.query}")
+    return ('title', (result.get('title') or '').strip().lower())
+
+
+class FusionEngine:
+    """
+    Reciprocal-rank fusion over the local, web and keyword result lists.
+    Each list contributes weight / (k + rank) for every item it returns, so
+    sources are combined by rank instead of by scores on unrelated scales.
+    Items found by several sources (the same sentence ID, or the same URL) are
+    merged into one entry that keeps every source in its provenance.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, k: float = 60.0, top_k: int = 5):
+        self.weights = {'local': 0.5, 'web': 0.3, 'keyword': 0.2}
+        self.weights.update(weights or {})
+        self.k = k
+        self.top_k = top_k
+
+    def fuse(self, results_by_source: Dict[str, List[Dict]], weights: Optional[Dict[str, float]] = None,
+             top_k: Optional[int] = None) -> List[Dict]:
+
+        weights = {**self.weights, **(weights or {})}
+        top_k = self.top_k if top_k is None else top_k
+
+        merged = {}
+        for source, results in results_by_source.items():
+            weight = weights.get(source, 0.0)
+            for rank, result in enumerate(results, 1):
+                key = result_key(result)
+                contribution = weight / (self.k + rank)
+                provenance = {'search_type': SEARCH_TYPES[source], 'rank': rank, 'score': result.get('score')}
+
+                entry = merged.get(key)
+                if entry is None:
+                    entry = dict(result)
+                    entry['search_type'] = SEARCH_TYPES[source]
+                    entry['final_score'] = 0.0
+                    entry['provenance'] = []
+                    entry['_best'] = -1.0
+                    merged[key] = entry
+
+                entry['final_score'] += contribution
+                entry['provenance'].append(provenance)
+                # The strongest contributor decides how the merged item is presented.
+                if contribution > entry['_best']:
+                    entry.update(result)
+                    entry['_best'] = contribution
+                    entry['search_type'] = SEARCH_TYPES[source]
+
+        top = heapq.nlargest(top_k, merged.values(), key=lambda entry: entry['final_score'])
+        for entry in top:
+            del entry['_best']
+            entry['matched_by'] = [provenance['search_type'] for provenance in entry['provenance']]
+        return top
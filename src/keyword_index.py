@@ -0,0 +1,67 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Iterable, List, Tuple
+
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[./][a-z0-9]+)*')
+
+
+def tokenize(text: str) -> List[str]:
+
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index over the corpus with Okapi BM25 scoring.
+    Built once at load time; a query only touches the postings of its own terms.
+    """
+
+    def __init__(self, documents: Iterable[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+
+        for doc_id, text in enumerate(documents):
+            terms = Counter(tokenize(text))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((doc_id, tf))
+
+        self.num_docs = len(self.doc_lengths)
+        self.avg_doc_length = sum(self.doc_lengths) / self.num_docs if self.num_docs else 0.0
+        self.length_norms = [
+            1 - b + b * length / self.avg_doc_length if self.avg_doc_length else 1.0
+            for length in self.doc_lengths
+        ]
+        self.idf = {
+            term: math.log(1 + (self.num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def __len__(self):
+        return self.num_docs
+
+    def search(self, query_terms: Iterable[str], top_k: int = 3) -> List[Tuple[int, float, float]]:
+        """
+        Returns (doc_id, bm25_score, normalized_score) for the best top_k documents.
+        The normalized score divides by the best score any document could reach
+        for these terms, so it stays in [0, 1] like the old keyword match ratio.
+        """
+
+        terms = {term for query_term in query_terms for term in tokenize(query_term) if term in self.postings}
+        if not terms:
+            return []
+
+        scores = defaultdict(float)
+        for term in terms:
+            idf = self.idf[term]
+            for doc_id, tf in self.postings[term]:
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * self.length_norms[doc_id])
+
+        best_possible = sum(self.idf[term] * (self.k1 + 1) for term in terms)
+        top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(doc_id, score, min(score / best_possible, 1.0)) for doc_id, score in top]
@@ -0,0 +1,89 @@
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over a tagged keyword vocabulary.
+    One left-to-right pass over the text reports every keyword occurrence, so
+    matching cost grows with the text length rather than the vocabulary size.
+    Matching is case-sensitive; callers lowercase the text themselves.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]):
+        self.patterns = []
+        self.pattern_tags = []
+        pattern_ids = {}
+
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for pattern, tag in entries:
+            if not pattern:
+                continue
+            if pattern not in pattern_ids:
+                pattern_ids[pattern] = len(self.patterns)
+                self.patterns.append(pattern)
+                self.pattern_tags.append([])
+                self._insert(pattern, pattern_ids[pattern])
+            if tag not in self.pattern_tags[pattern_ids[pattern]]:
+                self.pattern_tags[pattern_ids[pattern]].append(tag)
+
+        self._build_failure_links()
+
+    def _insert(self, pattern: str, pattern_id: int):
+
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(pattern_id)
+
+    def _build_failure_links(self):
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def _scan(self, text: str):
+
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern_id in output[node]:
+                yield position + 1, pattern_id
+
+    def find_all(self, text: str) -> List[Tuple[int, str]]:
+        """Returns (end_index, pattern) for every occurrence, in text order."""
+
+        return [(end, self.patterns[pattern_id]) for end, pattern_id in self._scan(text)]
+
+    def match(self, text: str) -> Dict[str, List[str]]:
+        """Maps each tag to the distinct patterns found for it, in order of first occurrence."""
+
+        tagged = {}
+        seen = set()
+        for _, pattern_id in self._scan(text):
+            if pattern_id in seen:
+                continue
+            seen.add(pattern_id)
+            for tag in self.pattern_tags[pattern_id]:
+                tagged.setdefault(tag, []).append(self.patterns[pattern_id])
+        return tagged
@@ -1,28 +1,89 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List, Dict, Tuple
 from .embeddings import MedicalEmbeddings
 from .web_search import SerperWebSearch
-from .triage import MedicalTriage
+from .triage import MedicalTriage, TriageResult
+from .fusion import FusionEngine
+from .keyword_index import BM25Index
+from .tracing import Trace, span
 
 class HybridRetrieval:
 
     
-    def __init__(self):
-        self.embeddings = MedicalEmbeddings()
+    def __init__(self, retrieval_timeout: float = None, max_workers: int = 8):
+        self.embeddings = MedicalEmbeddings(
+            cache_dir=os.getenv('EMBEDDING_CACHE_DIR', '.cache/embeddings'),
+            index_backend=os.getenv('VECTOR_INDEX_BACKEND', 'qdrant'),
+            index_path=os.getenv('VECTOR_INDEX_PATH') or None,
+            index_quantization=os.getenv('VECTOR_INDEX_QUANTIZATION') or None,
+            rescore_multiplier=float(os.getenv('VECTOR_INDEX_RESCORE_MULTIPLIER', '0')) or None,
+        )
+        # Optional persistent Qdrant server; with sync on, start-up only embeds
+        # and upserts sentences that changed since the index was last built.
+        self.index_url = os.getenv('QDRANT_URL') or None
+        self.index_sync = os.getenv('VECTOR_INDEX_SYNC', 'true').lower() not in ('0', 'false', 'no')
         self.web_search = SerperWebSearch()
         self.triage = MedicalTriage()
+        self.keyword_index = None
         
-    def initialize(self, file_path='data/Assignment-Data-Base.xlsx'):
+        # Reciprocal-rank fusion settings: per-source weights, the RRF k constant and the context size.
+        self.fusion = FusionEngine(
+            weights={
+                'local': float(os.getenv('FUSION_LOCAL_WEIGHT', '0.5')),
+                'web': float(os.getenv('FUSION_WEB_WEIGHT', '0.3')),
+                'keyword': float(os.getenv('FUSION_KEYWORD_WEIGHT', '0.2')),
+            },
+            k=float(os.getenv('FUSION_RRF_K', '60')),
+            top_k=int(os.getenv('FUSION_TOP_K', '5')),
+        )
         
-        self.embeddings.initialize_qdrant()
-        self.embeddings.load_medical_sentences(file_path)
-        self.embeddings.create_embeddings()
+        # Seconds hybrid_search waits for its retrievers before fusing whatever has finished.
+        if retrieval_timeout is None:
+            retrieval_timeout = float(os.getenv('RETRIEVAL_TIMEOUT_SECONDS', '12'))
+        self.retrieval_timeout = retrieval_timeout
+        
+        # Adaptive web search: skip Serper when the best local hit already scores at least
+        # web_skip_score, give it at most web_deadline seconds, and optionally send a hedged
+        # duplicate request when the first has not answered after web_hedge_after seconds.
+        web_skip_score = os.getenv('WEB_SKIP_LOCAL_SCORE')
+        self.web_skip_score = float(web_skip_score) if web_skip_score else None
+        self.web_deadline = float(os.getenv('WEB_SEARCH_DEADLINE_SECONDS', '4'))
+        web_hedge_after = os.getenv('WEB_SEARCH_HEDGE_SECONDS')
+        self.web_hedge_after = float(web_hedge_after) if web_hedge_after else None
+        
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='retrieval')
+        # Web calls get their own pool: abandoned or hedged Serper requests keep
+        # running until their deadline and must not hold the threads that local
+        # and keyword search need.
+        self.web_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='web-search')
+        
+    def initialize(self, file_path='data/Assignment-Data-Base.xlsx', trace: Trace = None):
+        
+        with span(trace, 'index_init'):
+            self.embeddings.initialize_index(self.index_url)
+        with span(trace, 'corpus_load'):
+            self.embeddings.load_medical_sentences(file_path)
+        with span(trace, 'keyword_index'):
+            self.build_keyword_index()
+        with span(trace, 'model_load'):
+            self.embeddings.model
+        with span(trace, 'warmup_encode'):
+            self.embeddings.warm_up()
+        with span(trace, 'embeddings'):
+            if self.index_sync:
+                self.embeddings.sync_embeddings()
+            else:
+                self.embeddings.create_embeddings()
         
         print("Hybrid Retrieval System initialized successfully")
     
-    def perform_local_search(self, query: str, top_k: int = 3) -> List[Dict]:
+    def perform_local_search(self, query: str, top_k: int = 3, trace: Trace = None) -> List[Dict]:
         
         try:
-            results = self.embeddings.search_similar(query, top_k)
+            results = self.embeddings.search_similar(query, top_k, trace=trace)
             
             
             for result in results:
@@ -34,84 +95,237 @@ class HybridRetrieval:
             print(f"Error in local search: {e}")
             return []
     
-    def perform_web_search(self, query: str, condition_type: str = None) -> List[Dict]:
+    def perform_local_search_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict]]:
+        
+        try:
+            batches = self.embeddings.search_similar_many(queries, top_k)
+            
+            for results in batches:
+                for result in results:
+                    result['source'] = 'local_knowledge'
+                    result['sentence']['source_type'] = 'verified_medical_content'
+            
+            return batches
+        except Exception as e:
+            print(f"Error in batched local search: {e}")
+            return [[] for _ in queries]
+    
+    def perform_web_search(self, query: str, condition_type: str = None, timeout: float = None) -> List[Dict]:
         
+        # timeout is the budget for the whole call, so Serper retries stop once it is spent.
+        deadline = None if timeout is None else time.perf_counter() + timeout
         try:
             if condition_type:
-                results = self.web_search.search_with_medical_keywords(query, condition_type)
+                results = self.web_search.search_with_medical_keywords(query, condition_type, timeout=timeout,
+                                                                       deadline=deadline)
             else:
-                results = self.web_search.search_medical_query(query)
+                results = self.web_search.search_medical_query(query, timeout=timeout, deadline=deadline)
             
             return results
         except Exception as e:
             print(f"Error in web search: {e}")
             return []
     
-    def perform_keyword_search(self, query: str) -> List[Dict]:
+    def build_keyword_index(self):
         
-        keywords = self.triage.extract_keywords(query)
+        self.keyword_index = BM25Index(sentence['content'] for sentence in self.embeddings.sentences)
+        return self.keyword_index
+    
+    def perform_keyword_search(self, query: str, top_k: int = 3, keywords: List[str] = None) -> List[Dict]:
+        
+        if keywords is None:
+            keywords = self.triage.extract_keywords(query)
+        if not keywords:
+            return []
         
+        if self.keyword_index is None or len(self.keyword_index) != len(self.embeddings.sentences):
+            self.build_keyword_index()
         
         keyword_results = []
-        for sentence in self.embeddings.sentences:
-            content_lower = sentence['content'].lower()
-            matches = sum(1 for keyword in keywords if keyword in content_lower)
-            
-            if matches > 0:
-                keyword_results.append({
-                    'sentence': sentence,
-                    'score': matches / len(keywords),  
-                    'rank': len(keyword_results) + 1,
-                    'source': 'keyword_search'
-                })
-        
-       
-        keyword_results.sort(key=lambda x: x['score'], reverse=True)
-        return keyword_results[:3]
+        for doc_id, _, score in self.keyword_index.search(keywords, top_k):
+            keyword_results.append({
+                'sentence': self.embeddings.sentences[doc_id],
+                'score': score,
+                'rank': len(keyword_results) + 1,
+                'source': 'keyword_search'
+            })
+        
+        return keyword_results
     
     def fuse_and_rank_results(self, local_results: List[Dict], web_results: List[Dict], 
-                             keyword_results: List[Dict], local_weight: float = 0.5, 
-                             web_weight: float = 0.3, keyword_weight: float = 0.2) -> List[Dict]:
+                             keyword_results: List[Dict], local_weight: float = None, 
+                             web_weight: float = None, keyword_weight: float = None) -> List[Dict]:
         
+        # Explicit weights override the configured ones for this call only.
+        overrides = {
+            source: weight
+            for source, weight in (('local', local_weight), ('web', web_weight), ('keyword', keyword_weight))
+            if weight is not None
+        }
+        return self.fusion.fuse(
+            {'local': local_results, 'web': web_results, 'keyword': keyword_results},
+            weights=overrides
+        )
+    
+    def _collect(self, futures: Dict, timeout: float) -> Dict[str, List[Dict]]:
         
-        all_results = []
+        done, _ = wait(futures.values(), timeout=timeout)
         
+        collected = {}
+        for name, future in futures.items():
+            if future not in done:
+                # Calls still queued are withdrawn; running ones finish in the background.
+                future.cancel()
+                print(f"{name} retrieval missed the {timeout:.1f}s deadline; dropping its results")
+                collected[name] = []
+                continue
+            try:
+                collected[name] = future.result()
+            except Exception as e:
+                print(f"Error in {name} retrieval: {e}")
+                collected[name] = []
         
-        for result in local_results:
-            result['final_score'] = result['score'] * local_weight
-            result['search_type'] = 'local_semantic'
-            all_results.append(result)
+        return collected
+    
+    @staticmethod
+    def _traced(trace: Trace, name: str, function, *args):
         
+        with span(trace, name):
+            return function(*args)
+    
+    def _web_search_within_deadline(self, query: str, condition_type: str, deadline: float,
+                                    trace: Trace, path: Dict) -> List[Dict]:
         
-        for i, result in enumerate(web_results):
-            relevance_score = 1.0 - (i * 0.1)  
-            result['final_score'] = relevance_score * web_weight
-            result['search_type'] = 'web_search'
-            all_results.append(result)
+        # deadline is an absolute perf_counter value; Serper's own timeout is capped to it.
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            path['web'] = 'late'
+            return []
         
+        submit = lambda: self.web_executor.submit(
+            self._traced, trace, 'web_search', self.perform_web_search, query, condition_type,
+            max(0.0, deadline - time.perf_counter())
+        )
+        futures = [submit()]
         
-        for result in keyword_results:
-            result['final_score'] = result['score'] * keyword_weight
-            result['search_type'] = 'keyword_search'
-            all_results.append(result)
+        if self.web_hedge_after is not None and self.web_hedge_after < remaining:
+            done, _ = wait(futures, timeout=self.web_hedge_after)
+            if not done:
+                path['hedged'] = True
+                futures.append(submit())
         
-      
-        all_results.sort(key=lambda x: x['final_score'], reverse=True)
+        done, _ = wait(futures, timeout=max(0.0, deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+        if not done:
+            print(f"web retrieval missed the {remaining:.1f}s deadline; dropping its results")
+            path['web'] = 'late'
+            return []
         
-        return all_results[:5]  
+        path['web'] = 'used'
+        try:
+            return next(iter(done)).result()
+        except Exception as e:
+            print(f"Error in web retrieval: {e}")
+            return []
     
-    def hybrid_search(self, query: str) -> Tuple[List[Dict], str]:
-       
+    def hybrid_search(self, query: str, timeout: float = None, triage_result: TriageResult = None,
+                      trace: Trace = None, path: Dict = None) -> Tuple[List[Dict], str]:
+        """
+        Runs local, keyword and web retrieval concurrently and fuses the results.
+        When given, `path` is filled with the adaptive web-search decision
+        ('skipped', 'used' or 'late'), whether a hedged request was sent, the top
+        local score and the deadlines that applied.
+        """
+        
+        start = time.perf_counter()
+        path = {} if path is None else path
+        budget = self.retrieval_timeout if timeout is None else timeout
+        web_deadline = min(self.web_deadline, budget)
+        path.update({'web': None, 'hedged': False, 'top_local_score': None,
+                     'budget_seconds': budget, 'web_deadline_seconds': web_deadline})
         
+        if triage_result is None:
+            with span(trace, 'triage'):
+                triage_result = self.triage.triage(query)
+        condition_type = triage_result.condition
         
-        condition_type = self.triage.detect_condition(query)
+        # The retrievers are independent, so latency is the slowest branch
+        # (bounded by the deadline) rather than their sum.
+        futures = {
+            'local': self.executor.submit(self._traced, trace, 'local_search', self.perform_local_search, query, 3, trace),
+            'keyword': self.executor.submit(self._traced, trace, 'keyword_search', self.perform_keyword_search,
+                                            query, 3, triage_result.keywords),
+        }
         
+        skip_web = False
+        if self.web_skip_score is not None:
+            # Local search is fast, so its top score decides whether Serper is worth waiting for.
+            local_results = self._collect({'local': futures.pop('local')}, budget)['local']
+            if local_results:
+                path['top_local_score'] = max(result['score'] for result in local_results)
+            skip_web = path['top_local_score'] is not None and path['top_local_score'] >= self.web_skip_score
         
-        local_results = self.perform_local_search(query, top_k=3)
-        web_results = self.perform_web_search(query, condition_type)
-        keyword_results = self.perform_keyword_search(query)
+        if skip_web:
+            path['web'] = 'skipped'
+            web_results = []
+        else:
+            web_results = self._web_search_within_deadline(
+                query, condition_type, start + web_deadline, trace, path
+            )
         
-       
-        fused_results = self.fuse_and_rank_results(local_results, web_results, keyword_results)
+        results = self._collect(futures, max(0.0, start + budget - time.perf_counter()))
+        if 'local' not in results:
+            results['local'] = local_results
+        elif results['local']:
+            path['top_local_score'] = max(result['score'] for result in results['local'])
+        
+        with span(trace, 'fusion'):
+            fused_results = self.fuse_and_rank_results(results['local'], web_results, results['keyword'])
         
         return fused_results, condition_type
+    
+    def hybrid_search_many(self, queries: List[str], include_web: bool = True,
+                           timeout: float = None) -> List[Tuple[List[Dict], str]]:
+        
+        triage_results = [self.triage.triage(query) for query in queries]
+        condition_types = [triage_result.condition for triage_result in triage_results]
+        
+        budget = self.retrieval_timeout if timeout is None else timeout
+        
+        # Web searches go out one pool-sized chunk at a time, and each chunk gets
+        # the full budget from its own start, so a large batch is not cut off
+        # after the first few hundred queries and nothing stays queued to call
+        # Serper after its results were given up on.
+        web_chunks = []
+        if include_web:
+            web_chunks = [range(start, min(start + self.max_workers, len(queries)))
+                          for start in range(0, len(queries), self.max_workers)]
+        
+        def submit_web(indices):
+            return time.perf_counter(), {
+                f'web:{i}': self.web_executor.submit(self.perform_web_search, queries[i], condition_types[i], budget)
+                for i in indices
+            }
+        
+        pending = submit_web(web_chunks[0]) if web_chunks else None
+        
+        local_batches = self.perform_local_search_many(queries, top_k=3)
+        keyword_batches = [
+            self.perform_keyword_search(query, 3, triage_result.keywords)
+            for query, triage_result in zip(queries, triage_results)
+        ]
+        
+        web_batches = {}
+        for n in range(len(web_chunks)):
+            started, web_futures = pending
+            web_batches.update(self._collect(web_futures, max(0.0, started + budget - time.perf_counter())))
+            if n + 1 < len(web_chunks):
+                pending = submit_web(web_chunks[n + 1])
+        
+        outputs = []
+        for i, condition_type in enumerate(condition_types):
+            fused_results = self.fuse_and_rank_results(
+                local_batches[i], web_batches.get(f'web:{i}', []), keyword_batches[i]
+            )
+            outputs.append((fused_results, condition_type))
+        
+        return outputs
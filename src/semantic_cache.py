@@ -0,0 +1,122 @@
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .cache import normalize_query
+from .triage import TriageResult
+
+
+NUMBER_PATTERN = re.compile(r'\d+\.?\d*')
+
+
+class SemanticResponseCache:
+    """
+    Reuses answers for near-duplicate queries ("sugar crashed, shaky" vs
+    "hypoglycemia shaking"). Query embeddings live in one preallocated float32
+    matrix, so a lookup is a single matrix-vector product.
+
+    A stored answer is only reused when, besides clearing the cosine threshold,
+    the new query triages to the same condition and urgency and quotes exactly
+    the same numbers (a glucose reading of 55 must never reuse an answer for 300).
+    Entries expire after ttl seconds; when full, the least recently used entry
+    is evicted.
+    """
+
+    def __init__(self, threshold: float = 0.92, capacity: int = 512, ttl: Optional[float] = 3600):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+
+        self._vectors = None
+        self._entries = [None] * capacity
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _numbers(query: str) -> Tuple[str, ...]:
+
+        return tuple(sorted(set(NUMBER_PATTERN.findall(normalize_query(query)))))
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _is_live(self, entry: Optional[Dict], now: float) -> bool:
+
+        return entry is not None and (not self.ttl or now - entry['stored_at'] < self.ttl)
+
+    def lookup(self, query_vector, triage_result: TriageResult, query: str) -> Optional[Tuple[Dict, float]]:
+
+        with self._lock:
+            if self._vectors is None:
+                self.misses += 1
+                return None
+
+            now = time.time()
+            similarities = self._vectors @ self._unit(query_vector)
+            numbers = self._numbers(query)
+
+            best_slot, best_score, near_miss = None, -1.0, False
+            for slot in np.flatnonzero(similarities >= self.threshold):
+                entry = self._entries[slot]
+                if not self._is_live(entry, now):
+                    continue
+                if (entry['condition'] != triage_result.condition
+                        or entry['urgency'] != triage_result.urgency
+                        or entry['numbers'] != numbers):
+                    near_miss = True
+                    continue
+                if similarities[slot] > best_score:
+                    best_slot, best_score = slot, float(similarities[slot])
+
+            if best_slot is None:
+                self.misses += 1
+                self.rejected += int(near_miss)
+                return None
+
+            self._last_used[best_slot] = now
+            self.hits += 1
+            return self._entries[best_slot]['response'], best_score
+
+    def store(self, query_vector, triage_result: TriageResult, query: str, response: Dict):
+
+        vector = self._unit(query_vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+
+            now = time.time()
+            free = [slot for slot, entry in enumerate(self._entries) if not self._is_live(entry, now)]
+            slot = free[0] if free else int(np.argmin(self._last_used))
+
+            self._vectors[slot] = vector
+            self._last_used[slot] = now
+            self._entries[slot] = {
+                'condition': triage_result.condition,
+                'urgency': triage_result.urgency,
+                'numbers': self._numbers(query),
+                'response': response,
+                'stored_at': now,
+            }
+
+    def stats(self) -> Dict:
+
+        lookups = self.hits + self.misses
+        return {
+            'size': sum(1 for entry in self._entries if entry is not None),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'rejected_by_safeguards': self.rejected,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,375 @@
+"""
+Headless HTTP/JSON API around FirstAidChatbot.
+
+    POST /v1/respond   {"query": "..."}                  full answer with sources and timings
+    POST /v1/search    {"query": "...", "timeout": 5}    fused hybrid retrieval results
+    POST /v1/triage    {"query": "..."}                  condition, urgency and keywords
+    GET  /ready                                          200 once the model and index are loaded
+    GET  /healthz                                        200 while the process is serving
+
+    python -m src.server --port 8080 --workers 4
+    python -m src.server --stand-ins        # offline: stand-in encoder, Gemini and Serper
+
+The parent process builds (or syncs) the vector index once; the worker
+processes then re-open it memory-mapped, so they share its pages instead of
+each holding a copy, and accept connections on one port via SO_REUSEPORT.
+Several workers need the numpy backend or a Qdrant server at QDRANT_URL; an
+in-memory Qdrant collection is replaced by the numpy index with a warning.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import numpy as np
+from aiohttp import web
+from dotenv import load_dotenv
+
+from .chatbot import FirstAidChatbot
+
+
+DEFAULT_SOURCE = 'data/Assignment-Data-Base.xlsx'
+DEFAULT_INDEX_PATH = '.cache/vector_index'
+MAX_QUERY_CHARS = 2000
+
+
+def _json_default(value):
+
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _dumps(data) -> str:
+
+    return json.dumps(data, default=_json_default, ensure_ascii=False)
+
+
+def _json_error(error_class, message: str, **headers):
+
+    return error_class(text=_dumps({'error': message}), content_type='application/json', headers=headers or None)
+
+
+class ChatbotService:
+    """
+    Runs the chatbot's blocking calls on a bounded thread pool.
+    At most max_concurrency calls execute at once and up to max_queue more may
+    wait for a thread; beyond that requests are turned away with 503 instead
+    of piling up. A call that outlives its timeout is answered with 504, and
+    keeps its slot until the worker thread actually finishes.
+    """
+
+    def __init__(self, chatbot: FirstAidChatbot, max_concurrency: int = 4, max_queue: int = 16,
+                 request_timeout: float = 30.0):
+        self.chatbot = chatbot
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.request_timeout = request_timeout
+        self.executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix='service')
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _release(self):
+        self.in_flight -= 1
+
+    def _release_from_thread(self, loop):
+
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # The server has shut down and its loop is closed.
+            pass
+
+    async def run(self, function: Callable, *args, timeout: Optional[float] = None):
+
+        if not self.chatbot.ready.is_set():
+            raise _json_error(web.HTTPServiceUnavailable, 'Service is starting up', **{'Retry-After': '1'})
+        if self.in_flight >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise _json_error(web.HTTPServiceUnavailable, 'Too many concurrent requests', **{'Retry-After': '1'})
+
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda _: self._release_from_thread(loop))
+
+        timeout = self.request_timeout if timeout is None else min(timeout, self.request_timeout)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            # Only a call still waiting for a thread can be withdrawn.
+            future.cancel()
+            self.timed_out += 1
+            raise _json_error(web.HTTPGatewayTimeout, f'Request exceeded {timeout:g}s')
+
+    def stats(self) -> Dict:
+
+        return {
+            'in_flight': self.in_flight,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+SERVICE = web.AppKey('service', ChatbotService)
+
+
+async def _read_query(request: web.Request) -> Dict:
+
+    try:
+        body = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        raise _json_error(web.HTTPBadRequest, 'Body must be a JSON object')
+    if not isinstance(body, dict):
+        raise _json_error(web.HTTPBadRequest, 'Body must be a JSON object')
+
+    query = body.get('query')
+    if not isinstance(query, str) or not query.strip():
+        raise _json_error(web.HTTPBadRequest, "'query' must be a non-empty string")
+    if len(query) > MAX_QUERY_CHARS:
+        raise _json_error(web.HTTPBadRequest, f"'query' is longer than {MAX_QUERY_CHARS} characters")
+    return body
+
+
+def _timeout(body: Dict) -> Optional[float]:
+
+    timeout = body.get('timeout')
+    if timeout is None:
+        return None
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+        raise _json_error(web.HTTPBadRequest, "'timeout' must be a positive number of seconds")
+    return float(timeout)
+
+
+async def respond(request: web.Request) -> web.Response:
+
+    service = request.app[SERVICE]
+    body = await _read_query(request)
+    result = await service.run(service.chatbot.generate_response, body['query'], timeout=_timeout(body))
+    return web.json_response(result, dumps=_dumps)
+
+
+async def search(request: web.Request) -> web.Response:
+
+    service = request.app[SERVICE]
+    body = await _read_query(request)
+    timeout = _timeout(body)
+
+    def run():
+        path = {}
+        results, condition = service.chatbot.retrieval.hybrid_search(body['query'], timeout=timeout, path=path)
+        return {'query': body['query'], 'condition': condition, 'results': results, 'retrieval_path': path}
+
+    return web.json_response(await service.run(run, timeout=timeout), dumps=_dumps)
+
+
+async def triage(request: web.Request) -> web.Response:
+
+    # Triage is a memoised keyword pass with no model behind it, so it is
+    # answered inline and stays available while the service warms up.
+    service = request.app[SERVICE]
+    body = await _read_query(request)
+    return web.json_response(service.chatbot.triage.triage(body['query']).as_dict(), dumps=_dumps)
+
+
+async def ready(request: web.Request) -> web.Response:
+
+    chatbot = request.app[SERVICE].chatbot
+    payload = {
+        'ready': chatbot.ready.is_set(),
+        'pid': os.getpid(),
+        'startup_timings': chatbot.startup_timings,
+        'index': chatbot.retrieval.embeddings.last_ingestion_stats,
+    }
+    if chatbot.startup_error is not None:
+        payload['error'] = str(chatbot.startup_error)
+    return web.json_response(payload, status=200 if payload['ready'] else 503, dumps=_dumps)
+
+
+async def healthz(request: web.Request) -> web.Response:
+
+    return web.json_response({'status': 'ok', 'pid': os.getpid(), **request.app[SERVICE].stats()})
+
+
+def create_app(chatbot: FirstAidChatbot, file_path: Optional[str] = None, max_concurrency: int = 4,
+               max_queue: int = 16, request_timeout: float = 30.0) -> web.Application:
+    """
+    Builds the aiohttp application. When file_path is given the chatbot warms
+    up in the background once the server starts, and /ready reports when it
+    is done; otherwise the chatbot is expected to be initialized already.
+    """
+
+    service = ChatbotService(chatbot, max_concurrency, max_queue, request_timeout)
+    app = web.Application(client_max_size=64 * 1024)
+    app[SERVICE] = service
+    app.add_routes([
+        web.post('/v1/respond', respond),
+        web.post('/v1/search', search),
+        web.post('/v1/triage', triage),
+        web.get('/ready', ready),
+        web.get('/healthz', healthz),
+    ])
+
+    async def start_warmup(app):
+        chatbot.start_warmup(file_path)
+
+    async def close_service(app):
+        service.close()
+
+    if file_path is not None:
+        app.on_startup.append(start_warmup)
+    app.on_cleanup.append(close_service)
+    return app
+
+
+def _use_stand_ins(chatbot: FirstAidChatbot, options: Dict):
+
+    from benchmarks.pipeline import StandInEncoder, StandInGenerativeModel
+
+    chatbot.model = StandInGenerativeModel(latency=options['llm_latency'])
+    chatbot.retrieval.embeddings.model = StandInEncoder()
+
+
+def prepare_index(options: Dict):
+    """Builds or syncs the shared vector index once, before any worker opens it"""
+
+    from .retrieval import HybridRetrieval
+
+    retrieval = HybridRetrieval()
+    if options['stand_ins']:
+        from benchmarks.pipeline import StandInEncoder
+        retrieval.embeddings.model = StandInEncoder()
+    retrieval.embeddings.initialize_index(retrieval.index_url)
+    retrieval.embeddings.load_medical_sentences(options['file_path'])
+    retrieval.embeddings.sync_embeddings(show_progress=False)
+    retrieval.executor.shutdown(wait=False)
+    retrieval.web_executor.shutdown(wait=False)
+
+
+def _run_worker(options: Dict):
+
+    chatbot = FirstAidChatbot()
+    if options['stand_ins']:
+        _use_stand_ins(chatbot, options)
+    app = create_app(chatbot, options['file_path'], options['max_concurrency'], options['max_queue'],
+                     options['request_timeout'])
+    web.run_app(app, host=options['host'], port=options['port'], reuse_port=options['workers'] > 1, print=None)
+
+
+def _terminate(signum, frame):
+    raise SystemExit(0)
+
+
+def serve(options: Dict):
+
+    workdir = stand_in_serper = None
+    if options['stand_ins']:
+        from benchmarks.pipeline import StandInSerper
+
+        # Stand-in vectors must never reach the real index or embedding cache.
+        workdir = tempfile.mkdtemp(prefix='first-aid-service-')
+        stand_in_serper = StandInSerper(latency=options['web_latency'])
+        os.environ.update({
+            'GOOGLE_API_KEY': os.getenv('GOOGLE_API_KEY') or 'stand-in',
+            'SERPER_API_KEY': os.getenv('SERPER_API_KEY') or 'stand-in',
+            'SERPER_BASE_URL': stand_in_serper.url,
+            'VECTOR_INDEX_PATH': os.path.join(workdir, 'index'),
+            'EMBEDDING_CACHE_DIR': os.path.join(workdir, 'embeddings'),
+        })
+
+    # Workers share the index through a saved, memory-mapped numpy index (or
+    # through the Qdrant server at QDRANT_URL) instead of building their own.
+    # An in-memory Qdrant collection lives in one process, so it only serves a
+    # single worker.
+    os.environ.setdefault('VECTOR_INDEX_BACKEND', 'numpy')
+    in_memory_qdrant = os.environ['VECTOR_INDEX_BACKEND'] == 'qdrant' and not os.getenv('QDRANT_URL')
+    if in_memory_qdrant and options['workers'] > 1:
+        print("Warning: an in-memory Qdrant index cannot be shared between worker processes; "
+              "using the numpy index instead (set QDRANT_URL to share a Qdrant server)")
+        os.environ['VECTOR_INDEX_BACKEND'] = 'numpy'
+        in_memory_qdrant = False
+    if os.environ['VECTOR_INDEX_BACKEND'] == 'numpy' and not os.getenv('VECTOR_INDEX_PATH'):
+        os.environ['VECTOR_INDEX_PATH'] = DEFAULT_INDEX_PATH
+
+    workers = []
+    try:
+        if not in_memory_qdrant:
+            prepare_index(options)
+        if options['workers'] <= 1:
+            _run_worker(options)
+            return
+
+        signal.signal(signal.SIGTERM, _terminate)
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=_run_worker, args=(options,), name=f'service-worker-{i}')
+                   for i in range(options['workers'])]
+        for worker in workers:
+            worker.start()
+        print(f"Serving on http://{options['host']}:{options['port']} with {len(workers)} workers")
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        if stand_in_serper is not None:
+            stand_in_serper.close()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=os.getenv('SERVER_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('SERVER_PORT', '8080')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SERVER_WORKERS', '1')))
+    parser.add_argument('--max-concurrency', type=int, default=int(os.getenv('SERVER_MAX_CONCURRENCY', '4')),
+                        help='chatbot calls executing at once in each worker')
+    parser.add_argument('--max-queue', type=int, default=int(os.getenv('SERVER_MAX_QUEUE', '16')),
+                        help='calls allowed to wait for a thread before requests get 503')
+    parser.add_argument('--request-timeout', type=float,
+                        default=float(os.getenv('SERVER_REQUEST_TIMEOUT_SECONDS', '30')))
+    parser.add_argument('--data', default=DEFAULT_SOURCE, help='knowledge base spreadsheet')
+    parser.add_argument('--stand-ins', action='store_true',
+                        help='use the offline stand-in encoder, Gemini and Serper from benchmarks.pipeline')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='stand-in Gemini latency in seconds')
+    parser.add_argument('--web-latency', type=float, default=0.3, help='stand-in Serper latency in seconds')
+    args = parser.parse_args(argv)
+
+    serve({
+        'host': args.host,
+        'port': args.port,
+        'workers': args.workers,
+        'max_concurrency': args.max_concurrency,
+        'max_queue': args.max_queue,
+        'request_timeout': args.request_timeout,
+        'file_path': args.data,
+        'stand_ins': args.stand_ins,
+        'llm_latency': args.llm_latency,
+        'web_latency': args.web_latency,
+    })
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
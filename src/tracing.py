@@ -0,0 +1,77 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class Trace:
+    """
+    Collects named timing spans for one request.
+    Spans may be opened from several threads at once (the retrievers run
+    concurrently), so each one records its start offset and thread name.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._spans.append({
+                    'name': name,
+                    'start_ms': round((start - self._origin) * 1000, 3),
+                    'duration_ms': round((end - start) * 1000, 3),
+                    'thread': threading.current_thread().name,
+                })
+
+    def elapsed(self) -> float:
+
+        return time.perf_counter() - self._origin
+
+    def spans(self) -> List[Dict]:
+
+        with self._lock:
+            return sorted(self._spans, key=lambda span: span['start_ms'])
+
+    def timings(self) -> Dict[str, float]:
+        """Total milliseconds per stage name, summed over repeated spans"""
+
+        totals = {}
+        for span in self.spans():
+            totals[span['name']] = round(totals.get(span['name'], 0.0) + span['duration_ms'], 3)
+        return totals
+
+
+def span(trace: Optional[Trace], name: str):
+    """trace.span(name), or a no-op when tracing is off"""
+
+    return trace.span(name) if trace is not None else contextlib.nullcontext()
+
+
+class TraceLog:
+    """Appends one JSON line per traced request; safe to share between threads"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, record: Dict):
+
+        line = json.dumps(record, default=str, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
@@ -1,71 +1,100 @@
 import re
-from typing import Optional, List
+from dataclasses import dataclass
+from typing import Dict, Optional, List, Tuple
+from .cache import LRUCache, normalize_query
+from .vocabulary import (
+    CONDITION_KEYWORDS, URGENCY_KEYWORDS, URGENCY_TAG, build_matcher, condition_tag, medical_matcher
+)
 
-class MedicalTriage:
+
+@dataclass(frozen=True)
+class TriageResult:
+    """Everything triage knows about one query, computed in a single pass."""
     
+    condition: Optional[str]
+    condition_scores: Dict[str, int]
+    urgency: str
+    urgency_matches: Tuple[str, ...]
+    keywords: Tuple[str, ...]
     
-    def __init__(self):
-        self.condition_keywords = {
-            'diabetes': [
-                'glucose', 'blood sugar', 'insulin', 'diabetic', 'hypoglycemia', 'hyperglycemia', 
-                'ketoacidosis', 'DKA', 'metformin', 'HbA1c', 'glucometer', 'shaky', 'sweating',
-                'gestational diabetes', 'type 1', 'type 2', 'mg/dL', 'fasting glucose'
-            ],
-            'cardiac': [
-                'chest pain', 'heart', 'cardiac', 'angina', 'myocardial', 'infarction', 
-                'crushing pain', 'left arm', 'nitroglycerin', 'aspirin', 'CPR', 'defibrillation',
-                'heart attack', 'heart failure', 'edema', 'shortness of breath', 'ankles swelling'
-            ],
-            'renal': [
-                'kidney', 'renal', 'creatinine', 'urine', 'potassium', 'dialysis', 'AKI', 'CKD',
-                'acute kidney injury', 'chronic kidney disease', 'nephrotoxic', 'barely urinated',
-                'ibuprofen', 'NSAIDs', 'flank pain', 'mmol/L'
-            ]
+    def as_dict(self) -> Dict:
+        
+        return {
+            'condition': self.condition,
+            'condition_scores': dict(self.condition_scores),
+            'urgency': self.urgency,
+            'urgency_matches': list(self.urgency_matches),
+            'keywords': list(self.keywords),
         }
+
+
+class MedicalTriage:
+    
+    
+    def __init__(self, condition_keywords=None, urgency_keywords=None, memo_size=2048):
+        self.condition_keywords = CONDITION_KEYWORDS if condition_keywords is None else condition_keywords
+        self.urgency_keywords = URGENCY_KEYWORDS if urgency_keywords is None else urgency_keywords
+        
+        # Every check below is answered from a single automaton pass over the query.
+        if condition_keywords is None and urgency_keywords is None:
+            self.matcher = medical_matcher()
+        else:
+            self.matcher = build_matcher(self.condition_keywords, self.urgency_keywords)
         
-        self.urgency_keywords = [
-            'unconscious', 'crushing', 'severe', 'emergency', 'call 112', 'ambulance',
-            'cannot breathe', 'chest pain', 'left arm', 'barely urinated'
-        ]
+        self._memo = LRUCache(memo_size)
     
-    def detect_condition(self, query: str) -> Optional[str]:
+    def triage(self, query: str) -> TriageResult:
+        
+        # Memoised per normalised query, so every stage of a request (and any
+        # repeat of the same query) shares one analysis.
+        normalized = normalize_query(query)
+        result = self._memo.get(normalized)
+        if result is None:
+            result = self._analyze(normalized)
+            self._memo.put(normalized, result)
+        return result
+    
+    def _analyze(self, normalized_query: str) -> TriageResult:
         
-        query_lower = query.lower()
+        matches = self.matcher.match(normalized_query)
         
         condition_scores = {}
-        for condition, keywords in self.condition_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in query_lower)
-            condition_scores[condition] = score
+        for condition in self.condition_keywords:
+            condition_scores[condition] = len(matches.get(condition_tag(condition), []))
         
+        condition = None
         if max(condition_scores.values()) > 0:
-            return max(condition_scores, key=condition_scores.get)
-        return None
-    
-    def assess_urgency(self, query: str) -> str:
-        
-        query_lower = query.lower()
-        urgent_matches = sum(1 for keyword in self.urgency_keywords if keyword in query_lower)
+            condition = max(condition_scores, key=condition_scores.get)
         
-        if urgent_matches >= 2:
-            return 'Very high'
-        elif urgent_matches == 1:
-            return 'high'
+        urgency_matches = tuple(matches.get(URGENCY_TAG, []))
+        if len(urgency_matches) >= 2:
+            urgency = 'Very high'
+        elif len(urgency_matches) == 1:
+            urgency = 'high'
         else:
-            return 'low'
-    
-    def extract_keywords(self, query: str) -> List[str]:
+            urgency = 'low'
         
-        query_lower = query.lower()
         extracted = []
+        for condition_name in self.condition_keywords:
+            extracted.extend(matches.get(condition_tag(condition_name), []))
+        extracted.extend(re.findall(r'\d+\.?\d*', normalized_query))
         
+        return TriageResult(
+            condition=condition,
+            condition_scores=condition_scores,
+            urgency=urgency,
+            urgency_matches=urgency_matches,
+            keywords=tuple(set(extracted)),
+        )
+    
+    def detect_condition(self, query: str) -> Optional[str]:
         
-        for condition, keywords in self.condition_keywords.items():
-            for keyword in keywords:
-                if keyword in query_lower:
-                    extracted.append(keyword)
-        
+        return self.triage(query).condition
+    
+    def assess_urgency(self, query: str) -> str:
         
-        numbers = re.findall(r'\d+\.?\d*', query)
-        extracted.extend(numbers)
+        return self.triage(query).urgency
+    
+    def extract_keywords(self, query: str) -> List[str]:
         
-        return list(set(extracted))
+        return list(self.triage(query).keywords)
@@ -0,0 +1,533 @@
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+QUANTIZATION_TYPES = ('int8', 'binary')
+
+# The +/-1 sign pattern of every byte value, in np.packbits bit order.
+_BYTE_SIGNS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(np.float32) * 2 - 1
+
+
+def normalize_rows(vectors) -> np.ndarray:
+
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+
+def _recall(approximate: Sequence[Sequence], exact: Sequence[Sequence]) -> float:
+
+    found = sum(len(set(approx) & set(truth)) for approx, truth in zip(approximate, exact))
+    total = sum(len(truth) for truth in exact)
+    return found / total if total else 1.0
+
+
+class QdrantVectorIndex:
+    """Vector index backed by a Qdrant collection (in-memory or remote)."""
+
+    def __init__(self, client, collection_name: str, quantization: Optional[str] = None,
+                 rescore_multiplier: Optional[float] = None):
+        if quantization is not None and quantization not in QUANTIZATION_TYPES:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.client = client
+        self.collection_name = collection_name
+        self.quantization = quantization
+        self.rescore_multiplier = rescore_multiplier or (10.0 if quantization == 'binary' else 4.0)
+
+    def _quantization_config(self):
+
+        from qdrant_client.models import (BinaryQuantization, BinaryQuantizationConfig, ScalarQuantization,
+                                          ScalarQuantizationConfig, ScalarType)
+
+        if self.quantization == 'int8':
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True))
+        if self.quantization == 'binary':
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def recreate(self, dimension: int):
+
+        from qdrant_client.models import Distance, VectorParams
+
+        try:
+            self.client.delete_collection(self.collection_name)
+        except Exception:
+            pass
+
+        # With quantization Qdrant keeps the codes in RAM and the original
+        # vectors on disk, reading them back only to rescore candidates.
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(size=dimension, distance=Distance.COSINE,
+                                        on_disk=self.quantization is not None or None),
+            quantization_config=self._quantization_config(),
+        )
+
+    def _matches(self, config, dimension: int) -> bool:
+
+        from qdrant_client.models import BinaryQuantization, Distance, ScalarQuantization
+
+        vectors = config.params.vectors
+        if getattr(vectors, 'size', None) != dimension or getattr(vectors, 'distance', None) != Distance.COSINE:
+            return False
+
+        stored = config.quantization_config
+        if stored is None:
+            quantization = None
+        elif isinstance(stored, ScalarQuantization):
+            quantization = 'int8'
+        elif isinstance(stored, BinaryQuantization):
+            quantization = 'binary'
+        else:
+            quantization = type(stored).__name__
+        return quantization == self.quantization
+
+    def ensure(self, dimension: int) -> bool:
+        """
+        Keeps an existing collection whose dimension, distance and quantization
+        match this index, and recreates it otherwise; True when existing points
+        are kept.
+        """
+
+        try:
+            info = self.client.get_collection(self.collection_name)
+        except Exception:
+            info = None
+        if info is not None and self._matches(info.config, dimension):
+            return True
+        self.recreate(dimension)
+        return False
+
+    def stored_hashes(self) -> Dict[int, Optional[str]]:
+        """content_hash payload of every stored point, by point id, read without vectors"""
+
+        hashes = {}
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=1024,
+                offset=offset,
+                with_payload=['content_hash'],
+                with_vectors=False,
+            )
+            for record in records:
+                hashes[record.id] = (record.payload or {}).get('content_hash')
+            if offset is None:
+                return hashes
+
+    def delete(self, ids: Sequence[int]):
+
+        from qdrant_client.models import PointIdsList
+
+        ids = list(ids)
+        if ids:
+            self.client.delete(collection_name=self.collection_name, points_selector=PointIdsList(points=ids))
+
+    def upsert(self, ids: Sequence[int], vectors: np.ndarray, payloads: Sequence[Dict]):
+
+        from qdrant_client.models import PointStruct
+
+        points = [
+            PointStruct(id=point_id, vector=np.asarray(vector).tolist(), payload=payload)
+            for point_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        self.client.upsert(collection_name=self.collection_name, points=points)
+
+    def flush(self):
+        pass
+
+    def count(self) -> int:
+
+        return self.client.count(self.collection_name).count
+
+    def _filter(self, category: Optional[str]):
+
+        if category is None:
+            return None
+
+        from qdrant_client.models import FieldCondition, Filter, MatchValue
+
+        return Filter(must=[FieldCondition(key='category', match=MatchValue(value=category))])
+
+    def _search_params(self, exact: bool):
+
+        from qdrant_client.models import QuantizationSearchParams, SearchParams
+
+        if exact:
+            return SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True))
+        if self.quantization is None:
+            return None
+        return SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=self.rescore_multiplier))
+
+    def _search_hits(self, query_vectors, top_k: int, category: Optional[str], exact: bool):
+
+        from qdrant_client.models import SearchRequest
+
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        query_filter = self._filter(category)
+        params = self._search_params(exact)
+        return self.client.search_batch(
+            collection_name=self.collection_name,
+            requests=[
+                SearchRequest(vector=vector.tolist(), filter=query_filter, limit=top_k, params=params,
+                              with_payload=True)
+                for vector in query_vectors
+            ],
+        )
+
+    def search(self, query_vectors, top_k: int, category: Optional[str] = None) -> List[List[Tuple[Dict, float]]]:
+
+        batches = self._search_hits(query_vectors, top_k, category, exact=False)
+        return [[(hit.payload, float(hit.score)) for hit in hits] for hits in batches]
+
+    def recall_at_k(self, query_vectors, top_k: int) -> float:
+        """Share of the exact top_k that the configured (possibly quantized) search also returns"""
+
+        approximate = self._search_hits(query_vectors, top_k, None, exact=False)
+        exact = self._search_hits(query_vectors, top_k, None, exact=True)
+        return _recall([[hit.id for hit in hits] for hits in approximate], [[hit.id for hit in hits] for hits in exact])
+
+
+class NumpyVectorIndex:
+    """
+    Exact cosine-similarity index held in a single contiguous float32 matrix.
+    Rows are L2-normalised on insert, so top-k is one matmul plus argpartition.
+    When a path is given the index is persisted there and re-opened memory-mapped,
+    letting several worker processes share the same pages.
+
+    With quantization='int8' (one byte per dimension) or 'binary' (one bit per
+    dimension) a first pass scores the compact codes block by block, and only
+    the best top_k * rescore_multiplier candidates are rescored against the
+    full-precision rows. Combined with a path, the float32 matrix stays on disk
+    and only those candidate rows are paged in.
+    """
+
+    BINARY_LOOKUP_MAX_QUERIES = 4
+
+    def __init__(self, path: Optional[str] = None, mmap: bool = True, quantization: Optional[str] = None,
+                 rescore_multiplier: Optional[float] = None, block_size: int = 8192):
+        if quantization is not None and quantization not in QUANTIZATION_TYPES:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.path = path
+        self.mmap = mmap
+        self.quantization = quantization
+        self.rescore_multiplier = rescore_multiplier or (10 if quantization == 'binary' else 4)
+        self.block_size = block_size
+        self.dimension = None
+        self._reset()
+
+    def _reset(self):
+
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = None
+        self._codes = None
+        self._scales = None
+        self._columns = {}
+        self._pending = []
+
+    def recreate(self, dimension: int):
+
+        self.dimension = dimension
+        self._reset()
+        self._vectors = np.empty((0, dimension), dtype=np.float32)
+
+    def ensure(self, dimension: int) -> bool:
+        """Re-opens the index saved at path when it matches this configuration; True when existing rows are kept"""
+
+        if self.path and os.path.exists(os.path.join(self.path, 'metadata.npz')):
+            loaded = NumpyVectorIndex.load(self.path, mmap=self.mmap, rescore_multiplier=self.rescore_multiplier)
+            if loaded.dimension == dimension and loaded.quantization == self.quantization:
+                self.__dict__.update(loaded.__dict__)
+                return True
+        self.recreate(dimension)
+        return False
+
+    def stored_hashes(self) -> Dict[int, Optional[str]]:
+        """content_hash payload of every stored row, by id (None for rows saved without one)"""
+
+        self._consolidate()
+        hashes = self._columns.get('content_hash')
+        if hashes is None:
+            return dict.fromkeys(self._ids.tolist())
+        return dict(zip(self._ids.tolist(), hashes.tolist()))
+
+    def delete(self, ids: Sequence[int]):
+
+        self._consolidate()
+        remove = np.isin(self._ids, np.asarray(list(ids), dtype=np.int64))
+        if not remove.any():
+            return
+
+        keep = ~remove
+        self._ids = self._ids[keep]
+        self._vectors = np.ascontiguousarray(self._vectors[keep])
+        self._columns = {key: column[keep] for key, column in self._columns.items()}
+        self._quantize()
+
+    def upsert(self, ids: Sequence[int], vectors: np.ndarray, payloads: Sequence[Dict]):
+
+        if self._vectors is None:
+            self.recreate(np.asarray(vectors).shape[1])
+
+        self._pending.append((np.asarray(ids, dtype=np.int64), normalize_rows(vectors), list(payloads)))
+
+    def _consolidate(self):
+
+        if not self._pending:
+            return
+
+        ids = [self._ids]
+        vectors = [np.asarray(self._vectors)]
+        columns = {key: [column] for key, column in self._columns.items()}
+
+        for chunk_ids, chunk_vectors, payloads in self._pending:
+            ids.append(chunk_ids)
+            vectors.append(chunk_vectors)
+            for key in payloads[0] if payloads else ():
+                columns.setdefault(key, []).append(np.array([payload[key] for payload in payloads]))
+
+        all_ids = np.concatenate(ids)
+        all_vectors = np.concatenate(vectors)
+        all_columns = {key: np.concatenate(parts) for key, parts in columns.items()}
+
+        # Later upserts of the same id replace earlier ones.
+        _, last = np.unique(all_ids[::-1], return_index=True)
+        keep = np.sort(len(all_ids) - 1 - last)
+
+        self._ids = all_ids[keep]
+        self._vectors = np.ascontiguousarray(all_vectors[keep])
+        self._columns = {key: column[keep] for key, column in all_columns.items()}
+        self._pending = []
+        self._quantize()
+
+    def _blocks(self, rows: int):
+
+        for start in range(0, rows, self.block_size):
+            yield slice(start, min(start + self.block_size, rows))
+
+    def _quantize(self):
+
+        if self.quantization is None:
+            self._codes = self._scales = None
+            return
+
+        vectors = self._vectors
+        if self.quantization == 'binary':
+            self._codes = np.packbits(vectors > 0, axis=1)
+            return
+
+        # Symmetric per-dimension int8 scales; rows are unit length, so every
+        # dimension already lies in [-1, 1].
+        scales = np.abs(vectors).max(axis=0) / 127.0 if len(vectors) else np.ones(vectors.shape[1])
+        scales[scales == 0] = 1.0
+        self._scales = scales.astype(np.float32)
+        self._codes = np.empty(vectors.shape, dtype=np.int8)
+        for block in self._blocks(len(vectors)):
+            self._codes[block] = np.clip(np.rint(vectors[block] / self._scales), -127, 127)
+
+    def flush(self):
+
+        self._consolidate()
+        if self.path:
+            self.save(self.path)
+            loaded = NumpyVectorIndex.load(self.path, mmap=self.mmap, rescore_multiplier=self.rescore_multiplier)
+            self.__dict__.update(loaded.__dict__)
+
+    def count(self) -> int:
+
+        self._consolidate()
+        return len(self._ids)
+
+    def _payload(self, row: int) -> Dict:
+
+        return {key: column[row].item() for key, column in self._columns.items()}
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Column indices and values of the k best scores in every row, best first"""
+
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def _category_mask(self, category: Optional[str], block: slice = slice(None)):
+
+        if category is None:
+            return None
+        return self._columns['category'][block] != category
+
+    def _exact_rows(self, queries: np.ndarray, top_k: int, category: Optional[str]):
+
+        scores = queries @ np.asarray(self._vectors).T
+        mask = self._category_mask(category)
+        if mask is not None:
+            scores[:, mask] = -np.inf
+        return self._top_k(scores, top_k)
+
+    def _coarse_scores(self, queries: np.ndarray, block: slice) -> np.ndarray:
+
+        codes = self._codes[block]
+        if self.quantization == 'int8':
+            return (queries * self._scales) @ codes.T.astype(np.float32)
+
+        # Binary codes hold one sign bit per dimension; the float query is scored
+        # against the +/-1 signs, which ranks better than Hamming distance.
+        if len(queries) > self.BINARY_LOOKUP_MAX_QUERIES:
+            signs = np.unpackbits(codes, axis=1, count=queries.shape[1]).astype(np.float32)
+            return queries @ (signs * 2 - 1).T
+
+        # For a few queries, a per-byte lookup table (the partial dot product
+        # for each of the 256 possible bytes) avoids unpacking the codes.
+        padded = np.zeros((len(queries), codes.shape[1] * 8), dtype=np.float32)
+        padded[:, :queries.shape[1]] = queries
+        scores = np.zeros((len(queries), codes.shape[0]), dtype=np.float32)
+        for query, row_scores in zip(padded, scores):
+            table = query.reshape(-1, 8) @ _BYTE_SIGNS.T
+            for byte in range(codes.shape[1]):
+                row_scores += table[byte][codes[:, byte]]
+        return scores
+
+    def _quantized_rows(self, queries: np.ndarray, top_k: int, category: Optional[str]):
+
+        candidates = max(top_k, int(top_k * self.rescore_multiplier))
+        best_rows, best_scores = [], []
+        for block in self._blocks(len(self._ids)):
+            scores = self._coarse_scores(queries, block)
+            mask = self._category_mask(category, block)
+            if mask is not None:
+                scores[:, mask] = -np.inf
+            rows, block_scores = self._top_k(scores, candidates)
+            best_rows.append(rows + block.start)
+            best_scores.append(block_scores)
+
+        columns, _ = self._top_k(np.concatenate(best_scores, axis=1), candidates)
+        rows = np.take_along_axis(np.concatenate(best_rows, axis=1), columns, axis=1)
+
+        # Rescore the candidates with full-precision vectors; only these rows are read.
+        results_rows, results_scores = [], []
+        for query, query_rows in zip(queries, rows):
+            query_rows = np.sort(query_rows)
+            exact = np.asarray(self._vectors[query_rows]) @ query
+            mask = self._category_mask(category)
+            if mask is not None:
+                exact[mask[query_rows]] = -np.inf
+            order, scores = self._top_k(exact[None, :], top_k)
+            results_rows.append(query_rows[order[0]])
+            results_scores.append(scores[0])
+        return np.array(results_rows), np.array(results_scores)
+
+    def _search_rows(self, query_vectors, top_k: int, category: Optional[str], exact: bool = False):
+
+        self._consolidate()
+        queries = normalize_rows(query_vectors)
+        if not len(self._ids) or top_k < 1:
+            return None, queries
+        if exact or self.quantization is None:
+            return self._exact_rows(queries, top_k, category), queries
+        return self._quantized_rows(queries, top_k, category), queries
+
+    def search(self, query_vectors, top_k: int, category: Optional[str] = None) -> List[List[Tuple[Dict, float]]]:
+
+        found, queries = self._search_rows(query_vectors, top_k, category)
+        if found is None:
+            return [[] for _ in queries]
+
+        top, top_scores = found
+        return [
+            [(self._payload(row), float(score)) for row, score in zip(rows, row_scores) if np.isfinite(score)]
+            for rows, row_scores in zip(top, top_scores)
+        ]
+
+    def recall_at_k(self, query_vectors, top_k: int) -> float:
+        """Share of the exact top_k that the configured (possibly quantized) search also returns"""
+
+        approximate, _ = self._search_rows(query_vectors, top_k, None)
+        exact, _ = self._search_rows(query_vectors, top_k, None, exact=True)
+        if exact is None:
+            return 1.0
+        return _recall(approximate[0].tolist(), exact[0].tolist())
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Bytes held by the full-precision vectors, the quantized codes and the ids plus payload columns"""
+
+        self._consolidate()
+        vectors_bytes = int(self._vectors.nbytes) if self._vectors is not None else 0
+        codes_bytes = int(self._codes.nbytes) if self._codes is not None else 0
+        if self._scales is not None:
+            codes_bytes += int(self._scales.nbytes)
+        payload_bytes = int(self._ids.nbytes) + sum(int(column.nbytes) for column in self._columns.values())
+        return {
+            'vectors_bytes': vectors_bytes,
+            'codes_bytes': codes_bytes,
+            'payload_bytes': payload_bytes,
+            'vectors_memory_mapped': isinstance(self._vectors, np.memmap),
+            'payload_memory_mapped': bool(self._columns) and all(
+                isinstance(column, np.memmap) for column in self._columns.values()
+            ),
+        }
+
+    def save(self, path: str):
+
+        self._consolidate()
+        os.makedirs(path, exist_ok=True)
+
+        # Write to temporary files first: the current vectors may be memory-mapped
+        # from the very file being replaced.
+        vectors_tmp = os.path.join(path, 'vectors.tmp.npy')
+        codes_tmp = os.path.join(path, 'codes.tmp.npy')
+        metadata_tmp = os.path.join(path, 'metadata.tmp.npz')
+        np.save(vectors_tmp, np.asarray(self._vectors))
+        quantization = {}
+        if self.quantization is not None:
+            np.save(codes_tmp, np.asarray(self._codes))
+            quantization['quantization'] = np.array(self.quantization)
+            if self._scales is not None:
+                quantization['scales'] = self._scales
+        # Payload columns (the sentence text above all) are saved one .npy file
+        # each so they can be memory-mapped like the vectors; only the rows a
+        # search returns are then paged in.
+        for key, column in self._columns.items():
+            np.save(os.path.join(path, f'payload_{key}.tmp.npy'), np.asarray(column))
+        np.savez(
+            metadata_tmp,
+            ids=self._ids,
+            payload_keys=np.array(list(self._columns), dtype=str),
+            **quantization,
+        )
+        os.replace(vectors_tmp, os.path.join(path, 'vectors.npy'))
+        if self.quantization is not None:
+            os.replace(codes_tmp, os.path.join(path, 'codes.npy'))
+        for key in self._columns:
+            os.replace(os.path.join(path, f'payload_{key}.tmp.npy'), os.path.join(path, f'payload_{key}.npy'))
+        os.replace(metadata_tmp, os.path.join(path, 'metadata.npz'))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, rescore_multiplier: Optional[float] = None) -> 'NumpyVectorIndex':
+
+        mmap_mode = 'r' if mmap else None
+        with np.load(os.path.join(path, 'metadata.npz'), allow_pickle=False) as data:
+            quantization = str(data['quantization']) if 'quantization' in data.files else None
+            index = cls(path=path, mmap=mmap, quantization=quantization, rescore_multiplier=rescore_multiplier)
+            index._ids = data['ids']
+            index._scales = data['scales'] if 'scales' in data.files else None
+            if 'payload_keys' in data.files:
+                index._columns = {
+                    str(key): np.load(os.path.join(path, f'payload_{key}.npy'), mmap_mode=mmap_mode)
+                    for key in data['payload_keys']
+                }
+            else:
+                # Indexes saved before the columns had their own files.
+                index._columns = {
+                    key[len('payload_'):]: data[key] for key in data.files if key.startswith('payload_')
+                }
+        index._vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode=mmap_mode)
+        index.dimension = index._vectors.shape[1]
+        if quantization is not None:
+            index._codes = np.load(os.path.join(path, 'codes.npy'), mmap_mode=mmap_mode)
+        return index
@@ -0,0 +1,69 @@
+from functools import lru_cache
+
+from .matcher import KeywordMatcher
+
+
+# Triage vocabularies. Queries are lowercased before matching, so entries
+# containing capitals (e.g. 'DKA', 'mg/dL') never match.
+CONDITION_KEYWORDS = {
+    'diabetes': [
+        'glucose', 'blood sugar', 'insulin', 'diabetic', 'hypoglycemia', 'hyperglycemia', 
+        'ketoacidosis', 'DKA', 'metformin', 'HbA1c', 'glucometer', 'shaky', 'sweating',
+        'gestational diabetes', 'type 1', 'type 2', 'mg/dL', 'fasting glucose'
+    ],
+    'cardiac': [
+        'chest pain', 'heart', 'cardiac', 'angina', 'myocardial', 'infarction', 
+        'crushing pain', 'left arm', 'nitroglycerin', 'aspirin', 'CPR', 'defibrillation',
+        'heart attack', 'heart failure', 'edema', 'shortness of breath', 'ankles swelling'
+    ],
+    'renal': [
+        'kidney', 'renal', 'creatinine', 'urine', 'potassium', 'dialysis', 'AKI', 'CKD',
+        'acute kidney injury', 'chronic kidney disease', 'nephrotoxic', 'barely urinated',
+        'ibuprofen', 'NSAIDs', 'flank pain', 'mmol/L'
+    ]
+}
+
+URGENCY_KEYWORDS = [
+    'unconscious', 'crushing', 'severe', 'emergency', 'call 112', 'ambulance',
+    'cannot breathe', 'chest pain', 'left arm', 'barely urinated'
+]
+
+# Knowledge-base categories, checked in order; the first category with a match wins.
+CATEGORY_KEYWORDS = {
+    'diabetes': ['diabetes', 'glucose', 'insulin', 'hypoglycaemia', 'hyperglycaemic', 'ketoacidosis', 'hba1c', 'metformin'],
+    'cardiac': ['chest pain', 'heart', 'cardiac', 'angina', 'myocardial', 'infarction', 'defibrillation', 'cpr'],
+    'renal': ['kidney', 'renal', 'creatinine', 'dialysis', 'aki', 'ckd', 'potassium', 'nephro'],
+}
+
+URGENCY_TAG = 'urgency'
+
+
+def condition_tag(condition: str) -> str:
+    return f'condition:{condition}'
+
+
+def category_tag(category: str) -> str:
+    return f'category:{category}'
+
+
+def build_matcher(condition_keywords=None, urgency_keywords=None, category_keywords=None) -> KeywordMatcher:
+
+    condition_keywords = CONDITION_KEYWORDS if condition_keywords is None else condition_keywords
+    urgency_keywords = URGENCY_KEYWORDS if urgency_keywords is None else urgency_keywords
+    category_keywords = CATEGORY_KEYWORDS if category_keywords is None else category_keywords
+
+    entries = []
+    for condition, keywords in condition_keywords.items():
+        entries.extend((keyword, condition_tag(condition)) for keyword in keywords)
+    entries.extend((keyword, URGENCY_TAG) for keyword in urgency_keywords)
+    for category, keywords in category_keywords.items():
+        entries.extend((keyword, category_tag(category)) for keyword in keywords)
+
+    return KeywordMatcher(entries)
+
+
+@lru_cache(maxsize=1)
+def medical_matcher() -> KeywordMatcher:
+    """The shared automaton over the default condition, urgency and category vocabularies."""
+
+    return build_matcher()
@@ -1,28 +1,179 @@
 import requests
+import json
 import os
+import random
+import threading
+import time
 from typing import List, Dict
+from requests.adapters import HTTPAdapter
+from .cache import DiskCache, LRUCache, TieredCache
+
+
+class WebSearchError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops outgoing calls for a cool-off window after repeated failures.
+    Once the window has passed a single trial call is let through; its outcome
+    closes the breaker again or re-opens it for another window.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
 
 class SerperWebSearch:
-    
-    
-    def __init__(self):
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str = None, timeout: float = 10.0, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 4.0, pool_size: int = 10,
+                 circuit_breaker: CircuitBreaker = None, cache_ttl: float = None, cache_path: str = None,
+                 cache_size: int = 512):
         self.api_key = os.getenv('SERPER_API_KEY')
         if not self.api_key:
             raise ValueError("SERPER_API_KEY not found in environment variables")
+
+        self.base_url = base_url or os.getenv('SERPER_BASE_URL', "https://google.serper.dev/search")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+        # One keep-alive session per client so repeated queries reuse pooled
+        # connections instead of paying a new TCP+TLS handshake each time.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'X-API-KEY': self.api_key,
+            'Content-Type': 'application/json',
+        })
         
-        self.base_url = "https://google.serper.dev/search"
-        
-    def search_medical_query(self, query: str, num_results: int = 3) -> List[Dict]:
+        # Results are cached per final request payload; a TTL of 0 disables caching.
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv('WEB_CACHE_TTL_SECONDS', '21600'))
+        cache_path = cache_path or os.getenv('WEB_CACHE_PATH') or None
+        self.cache = None
+        if cache_ttl > 0:
+            self.cache = TieredCache(
+                LRUCache(cache_size, ttl=cache_ttl),
+                DiskCache(cache_path, ttl=cache_ttl) if cache_path else None
+            )
+
+    def _backoff(self, attempt: int, retry_after: str = None) -> float:
+
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+
+        # Full jitter keeps concurrent clients from retrying in lockstep.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _post(self, data: Dict, timeout: float = None, deadline: float = None) -> Dict:
+
+        # timeout bounds each attempt; deadline (a time.perf_counter() value)
+        # bounds the whole call, retries and backoff included.
+        if deadline is not None and time.perf_counter() >= deadline:
+            raise WebSearchError("Serper deadline passed before the request was sent")
+        if not self.circuit_breaker.allow():
+            raise WebSearchError("Serper circuit breaker is open; skipping web search")
+
+        timeout = self.timeout if timeout is None else timeout
+        last_error = None
+        attempts = 0
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            attempt_timeout = timeout
+            if deadline is not None:
+                attempt_timeout = min(timeout, deadline - time.perf_counter())
+                if attempt_timeout <= 0:
+                    break
+            attempts += 1
+            try:
+                response = self.session.post(self.base_url, json=data, timeout=attempt_timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = e
+            except requests.exceptions.RequestException as e:
+                # Anything else (a broken chunked body, an invalid response) is not
+                # worth retrying, but must still count against the breaker so a
+                # half-open trial call is never left in flight.
+                self.circuit_breaker.record_failure()
+                raise WebSearchError(f"Serper request failed: {e}") from e
+            else:
+                if response.status_code in self.RETRY_STATUS_CODES:
+                    last_error = WebSearchError(f"Serper returned HTTP {response.status_code}")
+                    retry_after = response.headers.get('Retry-After')
+                elif response.ok:
+                    self.circuit_breaker.record_success()
+                    return response.json()
+                else:
+                    self.circuit_breaker.record_failure()
+                    raise WebSearchError(f"Serper returned HTTP {response.status_code}: {response.text[:200]}")
+
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt, retry_after)
+                if deadline is not None and time.perf_counter() + delay >= deadline:
+                    break
+                time.sleep(delay)
+
+        self.circuit_breaker.record_failure()
+        raise WebSearchError(f"Serper request failed after {attempts} attempts: {last_error}")
+
+    def search_medical_query(self, query: str, num_results: int = 3, timeout: float = None,
+                             deadline: float = None) -> List[Dict]:
         
         
         
         medical_query = f"{query} first aid emergency medical treatment"
         
-        headers = {
-            'X-API-KEY': self.api_key,
-            'Content-Type': 'application/json',
-        }
-        
         data = {
             'q': medical_query,
             'num': num_results,
@@ -30,45 +181,48 @@ class SerperWebSearch:
             'hl': 'en'
         }
         
-        try:
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=10)
-            response.raise_for_status()
-            
-            results = response.json()
-            search_results = []
-            
-           
-            if 'organic' in results:
-                for item in results['organic']:
-                    search_results.append({
-                        'title': item.get('title', ''),
-                        'snippet': item.get('snippet', ''),
-                        'link': item.get('link', ''),
-                        'source': 'web_search',
-                        'rank': len(search_results) + 1
-                    })
-            
-            
-            if 'knowledgeGraph' in results:
-                kg = results['knowledgeGraph']
-                search_results.insert(0, {
-                    'title': kg.get('title', ''),
-                    'snippet': kg.get('description', ''),
-                    'link': kg.get('website', ''),
-                    'source': 'knowledge_graph',
-                    'rank': 0
+        cache_key = json.dumps(data, sort_keys=True)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return [dict(result) for result in cached]
+        
+        results = self._post(data, timeout, deadline)
+        search_results = []
+        
+       
+        if 'organic' in results:
+            for item in results['organic']:
+                search_results.append({
+                    'title': item.get('title', ''),
+                    'snippet': item.get('snippet', ''),
+                    'link': item.get('link', ''),
+                    'source': 'web_search',
+                    'rank': len(search_results) + 1
                 })
-            
-            return search_results
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Error in web search: {e}")
-            return []
-        except Exception as e:
-            print(f"Unexpected error in web search: {e}")
-            return []
+        
+        
+        if 'knowledgeGraph' in results:
+            kg = results['knowledgeGraph']
+            search_results.insert(0, {
+                'title': kg.get('title', ''),
+                'snippet': kg.get('description', ''),
+                'link': kg.get('website', ''),
+                'source': 'knowledge_graph',
+                'rank': 0
+            })
+        
+        if self.cache is not None:
+            self.cache.put(cache_key, [dict(result) for result in search_results])
+        
+        return search_results
+    
+    def cache_stats(self) -> Dict:
+        
+        return self.cache.stats() if self.cache is not None else {}
     
-    def search_with_medical_keywords(self, query: str, condition_type: str = None) -> List[Dict]:
+    def search_with_medical_keywords(self, query: str, condition_type: str = None, timeout: float = None,
+                                     deadline: float = None) -> List[Dict]:
         
         
         medical_keywords = {
@@ -83,4 +237,4 @@ class SerperWebSearch:
         
         enhanced_query += " first aid treatment emergency medical"
         
-        return self.search_medical_query(enhanced_query)
+        return self.search_medical_query(enhanced_query, timeout=timeout, deadline=deadline)
@@ -0,0 +1,56 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pipeline import STAGES, find_regressions, main, run_benchmark, synthetic_corpus
+from src.corpus import load_or_build_corpus
+
+
+class TestPipelineBenchmark:
+
+    def test_reports_percentiles_per_stage_and_size(self):
+        """Test that a small offline run times every stage for each corpus size"""
+        results = run_benchmark([60, 300], queries=["chest pain and sweating", "my sugar is 55"],
+                                repeats=1, llm_latency=0.01, web_latency=0.01)
+
+        assert set(results['corpora']) == {'60', '300'}
+        for stages in results['corpora'].values():
+            assert set(stages) == set(STAGES)
+            for summary in stages.values():
+                assert summary['count'] == 2
+                assert summary['p50_ms'] <= summary['p95_ms'] <= summary['p99_ms']
+            assert stages['llm']['p50_ms'] >= 10
+            assert stages['end_to_end']['p50_ms'] >= stages['llm']['p50_ms']
+
+    def test_synthetic_corpus_grows_with_distinct_rows(self):
+        """Test that synthetic corpora reach the requested size without duplicate sentences"""
+        base = load_or_build_corpus('data/Assignment-Data-Base.xlsx')
+        corpus = synthetic_corpus(base, 3 * len(base) + 5)
+
+        assert len(corpus) == 3 * len(base) + 5
+        assert len(set(corpus.contents)) == len(corpus)
+        assert corpus[len(base)]['category'] == base[0]['category']
+
+    def test_regression_against_baseline_fails_run(self, tmp_path):
+        """Test that a stage slower than the stored baseline is reported and fails the run"""
+        results = {'corpora': {'60': {'llm': {'p95_ms': 200.0}, 'triage': {'p95_ms': 0.4}}}}
+        baseline = {'corpora': {'60': {'llm': {'p95_ms': 100.0}, 'triage': {'p95_ms': 0.2}}}}
+
+        regressions = find_regressions(results, baseline, tolerance=0.25, slack_ms=5.0)
+        assert len(regressions) == 1 and regressions[0].startswith('llm @ 60')
+
+        baseline_path = tmp_path / 'baseline.json'
+        output_path = tmp_path / 'results.json'
+        args = ['--sizes', '60', '--repeats', '1', '--llm-latency', '0', '--web-latency', '0',
+                '--baseline', str(baseline_path), '--output', str(output_path)]
+        assert main(args + ['--update-baseline']) == 0
+
+        stored = json.loads(baseline_path.read_text())
+        for summary in stored['corpora']['60'].values():
+            summary['p95_ms'] = 0.0
+        baseline_path.write_text(json.dumps(stored))
+
+        assert main(args + ['--llm-latency', '0.05']) == 1
+        assert json.loads(output_path.read_text())['corpora']['60']['llm']['p95_ms'] >= 50
@@ -1,11 +1,83 @@
+import json
 import pytest
 import sys
 import os
+import subprocess
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.chatbot import FirstAidChatbot, TEST_QUERIES
 from src.triage import MedicalTriage
 from src.embeddings import MedicalEmbeddings
+from src.corpus import build_corpus, categorize_sentence, load_or_build_corpus
+from src.vector_index import NumpyVectorIndex, QdrantVectorIndex
+from src.retrieval import HybridRetrieval
+from src.cache import EmbeddingCache, LRUCache, content_hash
+from src.keyword_index import BM25Index
+from src.fusion import FusionEngine
+from src.context_builder import ContextBuilder, estimate_tokens
+from src.matcher import KeywordMatcher
+from src.semantic_cache import SemanticResponseCache
+from src.rate_limit import RateLimiter
+from src.tracing import TraceLog
+from src.utils import save_performance_report
+import src.embeddings as embeddings_module
+
+
+class FakeEncoder:
+    """Deterministic stand-in for SentenceTransformer that records batch sizes"""
+    
+    def __init__(self, model_name=None):
+        self.calls = []
+    
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        items = [texts] if single else list(texts)
+        self.calls.append(len(items))
+        vectors = np.array(
+            [[len(t), t.count('a') + 1, t.count('e') + 1, 1.0] for t in items],
+            dtype=np.float32
+        )
+        return vectors[0] if single else vectors
+    
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel that replays a fixed answer in chunks"""
+    
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.prompts = []
+    
+    def generate_content(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        if stream:
+            return (FakeChunk(chunk) for chunk in self.chunks)
+        return FakeChunk(''.join(self.chunks))
+
+
+@pytest.fixture
+def offline_chatbot(monkeypatch, tmp_path):
+    """Chatbot wired to stand-in encoder and LLM, with web search disabled"""
+    monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    monkeypatch.setenv('SERPER_API_KEY', 'test-key')
+    monkeypatch.setenv('EMBEDDING_CACHE_DIR', str(tmp_path))
+    chatbot = FirstAidChatbot()
+    chatbot.retrieval.perform_web_search = lambda query, condition_type=None, timeout=None: []
+    chatbot.model = FakeGenerativeModel(['**Condition:** Hypoglycemia\n', '**Immediate Actions:** eat sugar [1]'])
+    chatbot.initialize('data/Assignment-Data-Base.xlsx')
+    return chatbot
+
 
 class TestFirstAidChatbot:
     
@@ -27,6 +99,464 @@ class TestFirstAidChatbot:
         assert len(sentences) == 60, "Should load exactly 60 sentences"
         assert all('id' in s and 'content' in s for s in sentences), "All sentences should have id and content"
     
+    def test_import_defers_heavy_dependencies(self):
+        """Test that importing the chatbot does not load torch, the encoder, Qdrant or Gemini"""
+        heavy = ['torch', 'sentence_transformers', 'qdrant_client', 'google.generativeai', 'pandas']
+        code = f"import sys, src.chatbot; print([m for m in {heavy!r} if m in sys.modules])"
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        assert output.stdout.strip() == '[]'
+    
+    def test_background_warmup_reports_startup_phases(self, monkeypatch, tmp_path):
+        """Test that warm-up loads model and index off the caller's thread and records phase timings"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+        monkeypatch.setenv('SERPER_API_KEY', 'test-key')
+        monkeypatch.setenv('EMBEDDING_CACHE_DIR', str(tmp_path))
+        
+        chatbot = FirstAidChatbot()
+        assert chatbot.retrieval.embeddings._model is None, "Encoder should load lazily"
+        
+        chatbot.model = FakeGenerativeModel(['**Condition:** Hypoglycemia'])
+        chatbot.start_warmup('data/Assignment-Data-Base.xlsx')
+        assert chatbot.wait_until_ready(timeout=30)
+        
+        assert {'index_init', 'corpus_load', 'keyword_index', 'model_load', 'warmup_encode',
+                'embeddings', 'gemini_client', 'total'} <= set(chatbot.startup_timings)
+        assert chatbot.retrieval.embeddings.model.calls[0] == 1, "First encode should be the warm-up"
+        assert chatbot.generate_response(TEST_QUERIES[0])['response']
+    
+    def test_compiled_corpus_matches_spreadsheet(self, tmp_path):
+        """Test that the columnar corpus round-trips and categorizes like the row-wise path"""
+        compiled_path = str(tmp_path / 'corpus.npz')
+        built = build_corpus('data/Assignment-Data-Base.xlsx', compiled_path)
+        loaded = load_or_build_corpus(compiled_path)
+        
+        assert len(loaded) == 60
+        assert list(loaded) == list(built)
+        assert all(s['category'] == categorize_sentence(s['content']) for s in loaded)
+    
+    def test_corpus_loads_from_read_only_data_directory(self, monkeypatch, tmp_path):
+        """Test that failing to save the compiled corpus falls back to the in-memory corpus"""
+        source = tmp_path / 'kb.xlsx'
+        source.write_bytes(open('data/Assignment-Data-Base.xlsx', 'rb').read())
+        
+        def read_only(*args, **kwargs):
+            raise PermissionError(13, 'Permission denied')
+        
+        monkeypatch.setattr(np, 'savez', read_only)
+        corpus = load_or_build_corpus(str(source))
+        
+        assert len(corpus) == 60
+        assert not (tmp_path / 'kb.corpus.npz').exists()
+    
+    def test_create_embeddings_streams_in_chunks(self, monkeypatch):
+        """Test that ingestion encodes and upserts in bounded chunks"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        embeddings = MedicalEmbeddings()
+        embeddings.initialize_qdrant()
+        embeddings.sentences = [
+            {'id': i, 'content': f'sentence {i}', 'category': 'general'} for i in range(1, 11)
+        ]
+        
+        count = embeddings.create_embeddings(batch_size=2, upsert_chunk_size=4, show_progress=False)
+        
+        assert count == 10
+        assert embeddings.model.calls == [4, 4, 2], "Should encode one call per chunk"
+        assert embeddings.client.count(embeddings.collection_name).count == 10
+        assert embeddings.last_ingestion_stats['sentences'] == 10
+    
+    def test_embedding_cache_skips_unchanged_sentences(self, monkeypatch, tmp_path):
+        """Test that a restart only encodes new or changed sentences"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        sentences = [{'id': i, 'content': f'sentence {i}', 'category': 'general'} for i in range(1, 6)]
+        
+        first = MedicalEmbeddings(cache_dir=str(tmp_path))
+        first.initialize_qdrant()
+        first.sentences = sentences
+        first.create_embeddings(show_progress=False)
+        
+        second = MedicalEmbeddings(cache_dir=str(tmp_path))
+        second.initialize_qdrant()
+        second.sentences = sentences + [{'id': 6, 'content': 'a new sentence', 'category': 'general'}]
+        second.create_embeddings(show_progress=False)
+        
+        assert second.model.calls == [1], "Only the new sentence should be encoded"
+        assert second.last_ingestion_stats['cache_hits'] == 5
+    
+    def test_sync_embeddings_applies_only_the_diff(self, monkeypatch, tmp_path):
+        """Test that syncing an existing index embeds changed sentences and deletes removed ones"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        sentences = [{'id': i, 'content': f'sentence {i}', 'category': 'general'} for i in range(1, 9)]
+        updated = [dict(s) for s in sentences if s['id'] != 3]
+        updated[0]['content'] = 'an edited sentence'
+        updated.append({'id': 9, 'content': 'a brand new sentence', 'category': 'general'})
+        
+        for backend in ('qdrant', 'numpy'):
+            embeddings = MedicalEmbeddings(index_backend=backend, index_path=str(tmp_path / 'index'))
+            embeddings.initialize_index()
+            embeddings.sentences = sentences
+            embeddings.sync_embeddings(show_progress=False)
+            assert embeddings.last_ingestion_stats['added'] == 8
+            
+            if backend == 'numpy':
+                # A restart re-opens the saved index instead of rebuilding it.
+                embeddings = MedicalEmbeddings(index_backend=backend, index_path=str(tmp_path / 'index'))
+                embeddings.initialize_index()
+            embeddings.model = FakeEncoder()
+            embeddings.sentences = updated
+            embeddings.sync_embeddings(show_progress=False)
+            
+            stats = embeddings.last_ingestion_stats
+            assert embeddings.model.calls == [2], "Only the edited and the new sentence should be encoded"
+            assert (stats['added'], stats['updated'], stats['deleted'], stats['unchanged']) == (1, 1, 1, 6)
+            assert embeddings.index.count() == 8
+            assert embeddings.index.stored_hashes() == {s['id']: content_hash(s['content']) for s in updated}
+            top = embeddings.search_similar('an edited sentence', top_k=1)[0]['sentence']
+            assert top['id'] == 1 and top['content'] == 'an edited sentence'
+            
+            embeddings.model = FakeEncoder()
+            embeddings.sync_embeddings(show_progress=False)
+            assert embeddings.model.calls == [], "An unchanged corpus should not be re-encoded"
+    
+    def test_qdrant_ensure_recreates_on_config_change(self):
+        """Test that an existing collection is only kept when dimension, distance and quantization all match"""
+        from qdrant_client import QdrantClient
+        from qdrant_client.models import Distance, VectorParams
+        
+        client = QdrantClient(":memory:")
+        plain = QdrantVectorIndex(client, 'kb')
+        assert plain.ensure(4) is False
+        plain.upsert([1], np.ones((1, 4), dtype=np.float32), [{'id': 1, 'content_hash': 'h'}])
+        assert plain.ensure(4) is True and plain.count() == 1
+        
+        quantized = QdrantVectorIndex(client, 'kb', quantization='int8')
+        assert quantized.ensure(4) is False, "A quantization change must rebuild the collection"
+        assert quantized.count() == 0
+        
+        client.recreate_collection('kb', vectors_config=VectorParams(size=4, distance=Distance.DOT))
+        assert plain.ensure(4) is False, "A distance change must rebuild the collection"
+        assert plain.ensure(8) is False
+    
+    def test_concurrent_saves_use_private_temp_files(self, tmp_path):
+        """Test that processes saving the same cache or index at once neither collide nor leave temp files"""
+        barrier = threading.Barrier(4)
+        errors = []
+        
+        def save(worker):
+            try:
+                cache = EmbeddingCache(str(tmp_path / 'cache'), 'model')
+                index = NumpyVectorIndex(path=str(tmp_path / 'index'), quantization='int8')
+                for round_ in range(10):
+                    cache.put_many([f'{worker}-{round_}'], np.ones((1, 4), dtype=np.float32) * worker)
+                    index.upsert([worker * 100 + round_], np.ones((1, 4), dtype=np.float32),
+                                 [{'id': worker * 100 + round_, 'content': f'sentence {round_}'}])
+                    barrier.wait()
+                    cache.save()
+                    index.save(index.path)
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=save, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == []
+        assert sorted(os.listdir(tmp_path / 'cache')) == ['model.npz']
+        assert not [name for name in os.listdir(tmp_path / 'index') if name.endswith('.tmp')]
+        assert len(EmbeddingCache(str(tmp_path / 'cache'), 'model')._rows) == 10
+        assert NumpyVectorIndex.load(str(tmp_path / 'index')).count() == 10
+    
+    def test_numpy_index_matches_qdrant(self, monkeypatch, tmp_path):
+        """Test that the numpy backend returns the same results as Qdrant, including filters"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        sentences = [
+            {'id': i, 'content': 'a' * i + ' e' * (10 - i), 'category': 'cardiac' if i % 2 else 'renal'}
+            for i in range(1, 10)
+        ]
+        
+        qdrant = MedicalEmbeddings(index_backend='qdrant')
+        numpy_backend = MedicalEmbeddings(index_backend='numpy', index_path=str(tmp_path / 'index'))
+        for embeddings in (qdrant, numpy_backend):
+            embeddings.initialize_index()
+            embeddings.sentences = sentences
+            embeddings.create_embeddings(show_progress=False)
+        
+        assert isinstance(numpy_backend.index, NumpyVectorIndex)
+        assert isinstance(numpy_backend.index._vectors, np.memmap), "Persisted index should be memory-mapped"
+        footprint = numpy_backend.index.memory_footprint()
+        assert footprint['payload_memory_mapped'], "Payload columns should be memory-mapped too"
+        assert footprint['payload_bytes'] >= numpy_backend.index._columns['content'].nbytes > 0
+        
+        for category in (None, 'renal'):
+            expected = qdrant.search_similar('aaa e', top_k=3, category=category)
+            actual = numpy_backend.search_similar('aaa e', top_k=3, category=category)
+            assert [r['sentence'] for r in actual] == [r['sentence'] for r in expected]
+            assert np.allclose([r['score'] for r in actual], [r['score'] for r in expected], atol=1e-5)
+    
+    def test_quantized_numpy_index_rescoring(self, tmp_path):
+        """Test that int8 and binary codes with full-precision rescoring keep recall and persist"""
+        rng = np.random.default_rng(7)
+        centers = rng.normal(size=(40, 64)).astype(np.float32)
+        vectors = centers[rng.integers(0, 40, 3000)] + 0.5 * rng.normal(size=(3000, 64)).astype(np.float32)
+        queries = vectors[rng.integers(0, 3000, 20)] + 0.2 * rng.normal(size=(20, 64)).astype(np.float32)
+        payloads = [{'id': i, 'category': ('renal', 'cardiac')[i % 2]} for i in range(3000)]
+        
+        exact = NumpyVectorIndex()
+        exact.upsert(range(3000), vectors, payloads)
+        
+        for quantization, min_recall in (('int8', 0.95), ('binary', 0.7)):
+            index = NumpyVectorIndex(path=str(tmp_path / quantization), quantization=quantization, block_size=1000)
+            index.upsert(range(3000), vectors, payloads)
+            index.flush()
+            
+            assert index.recall_at_k(queries, 5) >= min_recall
+            footprint = index.memory_footprint()
+            assert footprint['codes_bytes'] <= footprint['vectors_bytes'] / 3.9
+            
+            top = index.search(queries[:2], 5)
+            expected = exact.search(queries[:2], 5)
+            for hits, exact_hits in zip(top, expected):
+                assert hits[0][1] == pytest.approx(exact_hits[0][1], abs=1e-5), "Scores come from full-precision rescoring"
+            
+            reloaded = NumpyVectorIndex.load(str(tmp_path / quantization))
+            assert reloaded.quantization == quantization
+            assert [p['id'] for p, _ in reloaded.search(queries[:1], 5)[0]] == [p['id'] for p, _ in top[0]]
+            assert all(p['category'] == 'renal' for p, _ in reloaded.search(queries[:3], 5, category='renal')[0])
+    
+    def test_hybrid_search_many_matches_single_queries(self, monkeypatch, tmp_path):
+        """Test that batched retrieval encodes once and matches per-query results"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        monkeypatch.setenv('SERPER_API_KEY', 'test-key')
+        monkeypatch.setenv('EMBEDDING_CACHE_DIR', str(tmp_path))
+        retrieval = HybridRetrieval()
+        retrieval.perform_web_search = lambda query, condition_type=None, timeout=None: []
+        retrieval.initialize('data/Assignment-Data-Base.xlsx')
+        queries = TEST_QUERIES[:4]
+        
+        retrieval.embeddings.model.calls = []
+        batched = retrieval.hybrid_search_many(queries, include_web=False)
+        assert retrieval.embeddings.model.calls == [len(queries)], "Should encode all queries in one call"
+        
+        for query, (results, condition_type) in zip(queries, batched):
+            expected_results, expected_condition = retrieval.hybrid_search(query)
+            assert condition_type == expected_condition
+            assert [r['final_score'] for r in results] == pytest.approx([r['final_score'] for r in expected_results])
+    
+    def test_hybrid_search_many_gives_every_web_chunk_its_budget(self, monkeypatch):
+        """Test that a batch larger than the pool still gets web results and leaves no Serper calls queued"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        monkeypatch.setenv('SERPER_API_KEY', 'test-key')
+        retrieval = HybridRetrieval(max_workers=2)
+        
+        calls = []
+        def web(query, condition_type=None, timeout=None):
+            calls.append((query, timeout))
+            time.sleep(0.6 if 'stuck' in query else 0.1)
+            return [{'title': query, 'snippet': 's', 'link': f'https://example.org/{len(calls)}'}]
+        
+        retrieval.perform_web_search = web
+        retrieval.perform_local_search_many = lambda queries, top_k=3: [[] for _ in queries]
+        retrieval.perform_keyword_search = lambda query, top_k=3, keywords=None: []
+        
+        queries = [f"chest pain {i}" for i in range(6)]
+        outputs = retrieval.hybrid_search_many(queries, timeout=0.25)
+        assert [[r['title'] for r in results] for results, _ in outputs] == [[query] for query in queries]
+        assert all(timeout == 0.25 for _, timeout in calls), "Each call should carry the budget as its deadline"
+        
+        # Both threads are held by stuck calls, so the last chunk misses its
+        # budget while still queued and is withdrawn instead of calling Serper late.
+        calls.clear()
+        outputs = retrieval.hybrid_search_many(["stuck 1", "stuck 2", "chest pain"], timeout=0.25)
+        assert [results for results, _ in outputs] == [[], [], []]
+        time.sleep(0.8)
+        assert [query for query, _ in calls] == ["stuck 1", "stuck 2"]
+    
+    def test_query_cache_skips_encoder_for_repeats(self, monkeypatch):
+        """Test that repeated queries reuse cached vectors and the cache stays bounded"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        embeddings = MedicalEmbeddings(query_cache_size=2)
+        
+        first = embeddings.encode_query("Chest pain left arm")
+        second = embeddings.encode_query("  chest PAIN   left arm ")
+        embeddings.encode_queries(["kidney pain", "sugar low", "kidney pain"])
+        
+        assert np.array_equal(first, second)
+        assert embeddings.model.calls == [1, 2], "Repeats should not reach the encoder"
+        assert embeddings.query_cache.stats()['size'] == 2
+        assert embeddings.query_cache.hits == 1
+    
+    def test_lru_cache_evicts_least_recently_used(self):
+        """Test LRU eviction order and hit/miss counters"""
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+        assert cache.stats()['hits'] == 3 and cache.stats()['misses'] == 1
+    
+    def test_hybrid_search_runs_retrievers_concurrently(self, monkeypatch):
+        """Test that retrieval latency is the slowest branch and late branches are dropped"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        monkeypatch.setenv('SERPER_API_KEY', 'test-key')
+        retrieval = HybridRetrieval()
+        
+        def slow(delay, results):
+            def run(*args, **kwargs):
+                time.sleep(delay)
+                return results
+            return run
+        
+        local_hit = {'sentence': {'id': 1, 'content': 'local'}, 'score': 0.9, 'rank': 1}
+        retrieval.perform_local_search = slow(0.3, [local_hit])
+        retrieval.perform_keyword_search = slow(0.3, [])
+        retrieval.perform_web_search = slow(0.3, [{'title': 't', 'snippet': 's', 'link': 'l'}])
+        
+        start = time.perf_counter()
+        results, _ = retrieval.hybrid_search("chest pain")
+        assert time.perf_counter() - start < 0.6, "Retrievers should overlap"
+        assert len(results) == 2
+        
+        retrieval.perform_web_search = slow(2.0, [{'title': 't', 'snippet': 's', 'link': 'l'}])
+        start = time.perf_counter()
+        results, _ = retrieval.hybrid_search("chest pain", timeout=0.5)
+        assert time.perf_counter() - start < 1.0, "Should not wait past the deadline"
+        assert [r['search_type'] for r in results] == ['local_semantic']
+    
+    def test_adaptive_web_search_skips_hedges_and_abandons(self, monkeypatch):
+        """Test that strong local hits skip Serper, slow calls are hedged, and late ones are dropped"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        monkeypatch.setenv('SERPER_API_KEY', 'test-key')
+        monkeypatch.setenv('WEB_SKIP_LOCAL_SCORE', '0.8')
+        monkeypatch.setenv('WEB_SEARCH_DEADLINE_SECONDS', '0.5')
+        monkeypatch.setenv('WEB_SEARCH_HEDGE_SECONDS', '0.1')
+        retrieval = HybridRetrieval()
+        
+        web_delays = []
+        def web(query, condition_type=None, timeout=None):
+            time.sleep(web_delays.pop(0))
+            return [{'title': 't', 'snippet': 's', 'link': 'https://example.org/t'}]
+        
+        local_score = [0.9]
+        retrieval.perform_local_search = lambda query, top_k=3, trace=None: [
+            {'sentence': {'id': 1, 'content': 'local'}, 'score': local_score[0], 'rank': 1}
+        ]
+        retrieval.perform_keyword_search = lambda query, top_k=3, keywords=None: []
+        retrieval.perform_web_search = web
+        
+        path = {}
+        results, _ = retrieval.hybrid_search("chest pain", path=path)
+        assert path['web'] == 'skipped' and path['top_local_score'] == 0.9
+        assert [r['search_type'] for r in results] == ['local_semantic']
+        
+        local_score[0] = 0.4
+        web_delays[:] = [1.0, 0.05]
+        path = {}
+        start = time.perf_counter()
+        results, _ = retrieval.hybrid_search("chest pain", path=path)
+        assert time.perf_counter() - start < 0.4, "The hedged request should answer first"
+        assert path['web'] == 'used' and path['hedged']
+        assert 'web_search' in [r['search_type'] for r in results]
+        
+        web_delays[:] = [1.0, 1.0]
+        path = {}
+        start = time.perf_counter()
+        results, _ = retrieval.hybrid_search("chest pain", path=path)
+        assert time.perf_counter() - start < 0.8, "Web search must not run past its deadline"
+        assert path['web'] == 'late'
+        assert [r['search_type'] for r in results] == ['local_semantic']
+    
+    def test_late_web_calls_do_not_starve_local_retrieval(self, monkeypatch):
+        """Test that abandoned Serper calls cannot occupy the threads local and keyword search run on"""
+        monkeypatch.setattr(embeddings_module, 'SentenceTransformer', FakeEncoder)
+        monkeypatch.setenv('SERPER_API_KEY', 'test-key')
+        monkeypatch.setenv('WEB_SEARCH_DEADLINE_SECONDS', '0.1')
+        monkeypatch.delenv('WEB_SKIP_LOCAL_SCORE', raising=False)
+        monkeypatch.delenv('WEB_SEARCH_HEDGE_SECONDS', raising=False)
+        retrieval = HybridRetrieval(max_workers=2)
+        
+        def stuck_web(query, condition_type=None, timeout=None):
+            time.sleep(1.5)
+            return [{'title': 't', 'snippet': 's', 'link': 'https://example.org/t'}]
+        
+        retrieval.perform_web_search = stuck_web
+        retrieval.perform_local_search = lambda query, top_k=3, trace=None: [
+            {'sentence': {'id': 1, 'content': 'local'}, 'score': 0.5, 'rank': 1}
+        ]
+        retrieval.perform_keyword_search = lambda query, top_k=3, keywords=None: [
+            {'sentence': {'id': 2, 'content': 'keyword'}, 'score': 0.5, 'rank': 1}
+        ]
+        
+        with ThreadPoolExecutor(max_workers=6) as callers:
+            outcomes = list(callers.map(lambda i: retrieval.hybrid_search(f"chest pain {i}", timeout=0.7), range(6)))
+        
+        for results, _ in outcomes:
+            assert {r['search_type'] for r in results} == {'local_semantic', 'keyword_search'}
+    
+    def test_bm25_index_ranks_by_term_weight(self):
+        """Test that BM25 favours rare terms and normalizes scores into [0, 1]"""
+        index = BM25Index([
+            "Check blood glucose and give glucose tablets.",
+            "Potassium above 6.0 mmol/L needs emergency care.",
+            "Give glucose if the patient is conscious.",
+            "Call an ambulance for chest pain.",
+        ])
+        
+        results = index.search(['glucose', 'potassium'], top_k=2)
+        
+        assert [doc_id for doc_id, _, _ in results] == [1, 0]
+        assert all(0 < normalized <= 1 for _, _, normalized in results)
+        assert index.search(['dialysis']) == []
+    
+    def test_fusion_merges_duplicates_across_sources(self):
+        """Test that RRF fusion ranks by rank, merges repeated sentences and URLs, and keeps provenance"""
+        sentence = {'id': 7, 'content': 'Give 15 g of fast-acting sugar.', 'category': 'diabetes'}
+        other = {'id': 9, 'content': 'Recheck glucose after 15 minutes.', 'category': 'diabetes'}
+        local = [{'sentence': sentence, 'score': 0.81, 'rank': 1}, {'sentence': other, 'score': 0.52, 'rank': 2}]
+        keyword = [{'sentence': dict(sentence), 'score': 0.9, 'rank': 1}]
+        web = [
+            {'title': 'Hypoglycemia', 'snippet': 'Eat sugar.', 'link': 'https://Example.org/hypo/', 'rank': 1},
+            {'title': 'Hypoglycemia (mirror)', 'snippet': 'Eat sugar.', 'link': 'https://example.org/hypo', 'rank': 2},
+        ]
+        
+        fused = FusionEngine(k=60, top_k=5).fuse({'local': local, 'web': web, 'keyword': keyword})
+        
+        assert len(fused) == 3, "Sentence 7 and the mirrored URL should each appear once"
+        assert fused[0]['sentence']['id'] == 7
+        assert fused[0]['search_type'] == 'local_semantic'
+        assert fused[0]['matched_by'] == ['local_semantic', 'keyword_search']
+        assert fused[0]['final_score'] == pytest.approx(0.5 / 61 + 0.2 / 61)
+        assert fused[1]['matched_by'] == ['web_search', 'web_search']
+        
+        web_first = FusionEngine(weights={'web': 2.0}, top_k=1).fuse({'local': local, 'web': web, 'keyword': keyword})
+        assert len(web_first) == 1 and web_first[0]['search_type'] == 'web_search'
+    
+    def test_context_builder_respects_token_budget(self):
+        """Test that context stays within budget, collapses near-duplicates and renumbers citations"""
+        long_snippet = "Call emergency services now. " + "Keep the patient calm and seated while help arrives. " * 20
+        results = [
+            {'search_type': 'local_semantic', 'sentence': {'id': 3, 'content': 'Give 15 g of fast-acting sugar to a conscious patient.'}},
+            {'search_type': 'keyword_search', 'sentence': {'id': 4, 'content': 'Give 15 g of fast acting sugar to a conscious patient!'}},
+            {'search_type': 'web_search', 'title': 'Chest pain', 'snippet': long_snippet},
+            {'search_type': 'local_semantic', 'sentence': {'id': 8, 'content': 'Chew 300 mg aspirin unless allergic.'}},
+        ]
+        
+        built = ContextBuilder(token_budget=80, max_snippet_tokens=40).build(results)
+        
+        assert built.collapsed == 1 and built.trimmed == 1
+        assert estimate_tokens(built.text) <= built.tokens_used <= 80
+        assert [source['search_type'] for source in built.sources] == ['local_semantic', 'web_search', 'local_semantic']
+        assert built.text.startswith('[1] Local Knowledge (ID 3)')
+        assert '[2] Web Source: Chest pain' in built.text and '[3] Local Knowledge (ID 8)' in built.text
+        
+        tight = ContextBuilder(token_budget=30, max_snippet_tokens=40).build(results)
+        assert tight.dropped == 2 and len(tight.sources) == 1
+    
     def test_condition_detection(self):
         """Test triage condition detection"""
         triage = MedicalTriage()
@@ -46,6 +576,169 @@ class TestFirstAidChatbot:
         condition = triage.detect_condition(renal_query)
         assert condition == 'renal'
     
+    def test_keyword_matcher_single_pass(self):
+        """Test that the automaton reports overlapping keywords with all of their tags"""
+        matcher = KeywordMatcher([
+            ('chest pain', 'condition:cardiac'),
+            ('chest pain', 'urgency'),
+            ('pain', 'symptom'),
+            ('heart', 'condition:cardiac'),
+            ('heart failure', 'condition:cardiac'),
+        ])
+        
+        matches = matcher.match("heart failure with chest pain and more pain")
+        
+        assert matches['condition:cardiac'] == ['heart', 'heart failure', 'chest pain']
+        assert matches['urgency'] == ['chest pain']
+        assert matches['symptom'] == ['pain']
+        assert len(matcher.find_all("pain pain")) == 2
+    
+    def test_triage_computed_once_per_request(self, monkeypatch, offline_chatbot):
+        """Test that one generate_response call analyses the query exactly once"""
+        chatbot = offline_chatbot
+        
+        analyses = []
+        original_analyze = chatbot.triage._analyze
+        monkeypatch.setattr(chatbot.triage, '_analyze', lambda q: analyses.append(q) or original_analyze(q))
+        
+        result = chatbot.generate_response(TEST_QUERIES[3])
+        chatbot.generate_response(TEST_QUERIES[3].upper())
+        
+        assert chatbot.triage is chatbot.retrieval.triage
+        assert len(analyses) == 1, "Triage should run once and be memoised per normalised query"
+        assert result['condition_type'] == 'cardiac'
+        assert result['triage']['condition_scores']['cardiac'] >= 3
+        assert result['urgency_level'] == result['triage']['urgency']
+    
+    def test_streaming_emits_disclaimer_first(self, offline_chatbot):
+        """Test that streaming yields the disclaimer immediately and records time-to-first-token"""
+        offline_chatbot.model = FakeGenerativeModel([
+            '⚠', '️ This information is for educational purposes only.\n\n',
+            '**Condition:** Hypoglycemia\n', '**Immediate Actions:** give sugar [1]'
+        ])
+        
+        stream = offline_chatbot.generate_response_stream(TEST_QUERIES[0])
+        chunks = list(stream)
+        
+        assert chunks[0].startswith(offline_chatbot.disclaimer)
+        assert stream.result['response'].count('⚠️') == 1, "Model's own disclaimer should be dropped"
+        assert stream.result['response'].endswith('give sugar [1]')
+        assert 0 <= stream.result['time_to_first_token'] <= stream.result['response_time']
+    
+    def test_response_cache_skips_llm_for_repeats(self, offline_chatbot):
+        """Test that an identical query and context is answered from the response cache"""
+        first = offline_chatbot.generate_response(TEST_QUERIES[0])
+        second = offline_chatbot.generate_response(TEST_QUERIES[0])
+        stream = offline_chatbot.generate_response_stream(TEST_QUERIES[0])
+        list(stream)
+        
+        assert len(offline_chatbot.model.prompts) == 1, "Repeats should not call the LLM"
+        assert first['response'] == second['response'] == stream.result['response']
+        assert offline_chatbot.cache_stats()['response_cache']['memory_hits'] == 2
+    
+    def test_semantic_cache_reuses_near_duplicates(self, monkeypatch, offline_chatbot):
+        """Test that a reworded query reuses the answer but different numbers do not"""
+        chatbot = offline_chatbot
+        chatbot.semantic_cache = SemanticResponseCache(threshold=0.99)
+        
+        searches = []
+        original_search = chatbot.retrieval.hybrid_search
+        monkeypatch.setattr(chatbot.retrieval, 'hybrid_search',
+                            lambda query, **kwargs: searches.append(query) or original_search(query, **kwargs))
+        
+        first = chatbot.generate_response("my sugar is 55 and i feel shaky")
+        reworded = chatbot.generate_response("i feel shaky and my sugar is 55")
+        stream = chatbot.generate_response_stream("I feel shaky and my sugar is 55")
+        list(stream)
+        other_reading = chatbot.generate_response("my sugar is 56 and i feel shaky")
+        
+        assert reworded['cache'] == 'semantic'
+        assert reworded['response'] == first['response'] == stream.result['response']
+        assert stream.result['cache'] == 'semantic'
+        assert 'cache' not in other_reading, "A different glucose reading must not reuse the answer"
+        assert len(searches) == 2 and len(chatbot.model.prompts) == 2
+        assert chatbot.semantic_cache.stats()['rejected_by_safeguards'] == 1
+    
+    def test_semantic_cache_stream_strips_model_disclaimer(self, offline_chatbot):
+        """Test that a streamed semantic-cache hit keeps the body when the model wrote its own disclaimer"""
+        chatbot = offline_chatbot
+        chatbot.semantic_cache = SemanticResponseCache(threshold=0.99)
+        chatbot.model = FakeGenerativeModel(['⚠️ Disclaimer: not medical advice.\n\n', '**Condition:** Hypoglycemia [1]'])
+        
+        first = chatbot.generate_response("my sugar is 55 and i feel shaky")
+        stream = chatbot.generate_response_stream("I feel shaky and my sugar is 55")
+        chunks = list(stream)
+        
+        assert first['response'].startswith('⚠️ Disclaimer: not medical advice.')
+        assert stream.result['cache'] == 'semantic'
+        assert chunks == [f"{chatbot.disclaimer}\n\n", '**Condition:** Hypoglycemia [1]']
+    
+    def test_generate_responses_runs_batch_concurrently(self, offline_chatbot):
+        """Test that a batch is answered in parallel, bounded by max_concurrency, as results complete"""
+        class SlowModel(FakeGenerativeModel):
+            def __init__(self, chunks):
+                super().__init__(chunks)
+                self.in_flight = 0
+                self.peak = 0
+                self.lock = threading.Lock()
+            
+            def generate_content(self, prompt, stream=False):
+                with self.lock:
+                    self.in_flight += 1
+                    self.peak = max(self.peak, self.in_flight)
+                time.sleep(0.1)
+                with self.lock:
+                    self.in_flight -= 1
+                return super().generate_content(prompt, stream)
+        
+        offline_chatbot.model = SlowModel(['**Condition:** Hypoglycemia\n', '**Immediate Actions:** eat sugar [1]'])
+        queries = TEST_QUERIES[:6]
+        
+        start = time.perf_counter()
+        completed = list(offline_chatbot.generate_responses(queries, max_concurrency=3))
+        elapsed = time.perf_counter() - start
+        
+        assert sorted(i for i, _ in completed) == list(range(6))
+        assert all(result['query'] == queries[i] for i, result in completed)
+        assert all(result['response_time'] > 0 for _, result in completed)
+        assert offline_chatbot.model.peak == 3
+        assert elapsed < 6 * 0.1, "Batch should not take serial latency"
+    
+    def test_rate_limiter_paces_callers(self):
+        """Test that the token bucket spaces calls at the configured rate"""
+        limiter = RateLimiter(rate=50, burst=1)
+        
+        start = time.perf_counter()
+        for _ in range(6):
+            limiter.acquire()
+        
+        assert time.perf_counter() - start >= 5 / 50 * 0.9
+    
+    def test_generate_response_reports_stage_timings(self, monkeypatch, offline_chatbot, tmp_path):
+        """Test that every stage is timed, logged as JSONL and summarised in the performance report"""
+        offline_chatbot.trace_log = TraceLog(str(tmp_path / 'trace.jsonl'))
+        result = offline_chatbot.generate_response(TEST_QUERIES[0])
+        stream = offline_chatbot.generate_response_stream(TEST_QUERIES[1])
+        list(stream)
+        
+        expected = {'triage', 'retrieval', 'query_encoding', 'vector_search', 'local_search', 'web_search',
+                    'keyword_search', 'fusion', 'context_building', 'llm', 'total'}
+        assert expected <= set(result['timings'])
+        assert expected <= set(stream.result['timings'])
+        assert result['timings']['retrieval'] <= result['timings']['total']
+        assert {span['name'] for span in result['spans']} == expected - {'total'}
+        
+        lines = (tmp_path / 'trace.jsonl').read_text().splitlines()
+        assert len(lines) == 2
+        assert TEST_QUERIES[0] not in lines[0], "Trace log must not store raw queries"
+        assert json.loads(lines[0])['timings'] == result['timings']
+        
+        report_path = tmp_path / 'report.json'
+        save_performance_report([result, stream.result], str(report_path))
+        breakdown = json.loads(report_path.read_text())['stage_latency_breakdown']
+        assert breakdown['llm']['count'] == 2
+        assert breakdown['triage']['p50_ms'] <= breakdown['triage']['max_ms']
+    
     def test_urgency_assessment(self):
         """Test urgency level assessment"""
         triage = MedicalTriage()
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pipeline import StandInEncoder, StandInGenerativeModel, StandInSerper
+from src.chatbot import FirstAidChatbot
+from src.server import create_app
+import src.embeddings as embeddings_module
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def stand_in_chatbot(monkeypatch, tmp_path):
+    """Chatbot backed by the benchmark stand-ins for the encoder, Gemini and Serper, not yet initialized"""
+    serper = StandInSerper(latency=0.0)
+    monkeypatch.setattr(embeddings_module, 'SentenceTransformer', StandInEncoder)
+    for name, value in {
+        'GOOGLE_API_KEY': 'test-key',
+        'SERPER_API_KEY': 'test-key',
+        'SERPER_BASE_URL': serper.url,
+        'EMBEDDING_CACHE_DIR': str(tmp_path / 'embeddings'),
+        'RESPONSE_CACHE_TTL_SECONDS': '0',
+        'WEB_CACHE_TTL_SECONDS': '0',
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv('SEMANTIC_CACHE_THRESHOLD', raising=False)
+    monkeypatch.delenv('WEB_SKIP_LOCAL_SCORE', raising=False)
+    chatbot = FirstAidChatbot()
+    chatbot.model = StandInGenerativeModel(latency=0.0)
+    yield chatbot
+    serper.close()
+
+
+def _serve(app, scenario):
+
+    async def run():
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(client)
+
+    return asyncio.run(run())
+
+
+class TestService:
+
+    def test_json_endpoints(self, stand_in_chatbot):
+        """Test that respond, search, triage, ready and healthz answer with JSON"""
+        stand_in_chatbot.initialize('data/Assignment-Data-Base.xlsx')
+        app = create_app(stand_in_chatbot)
+
+        async def scenario(client):
+            responses = {}
+            for path, body in (('/v1/respond', {'query': 'low blood sugar, shaking and sweating'}),
+                               ('/v1/search', {'query': 'chest pain radiating to left arm', 'timeout': 5}),
+                               ('/v1/triage', {'query': 'chest pain radiating to left arm'})):
+                response = await client.post(path, json=body)
+                responses[path] = (response.status, await response.json())
+            for path in ('/ready', '/healthz'):
+                response = await client.get(path)
+                responses[path] = (response.status, await response.json())
+            for body in ('not json', json.dumps({'query': '  '}), json.dumps({'query': 'x', 'timeout': -1})):
+                response = await client.post('/v1/respond', data=body)
+                responses.setdefault('invalid', []).append((response.status, await response.json()))
+            return responses
+
+        responses = _serve(app, scenario)
+
+        status, result = responses['/v1/respond']
+        assert status == 200
+        assert result['response'].startswith('⚠️') and result['sources'] and 'timings' in result
+        assert result['triage']['condition'] == 'diabetes'
+
+        status, result = responses['/v1/search']
+        assert status == 200 and result['condition'] == 'cardiac'
+        assert {'local_semantic', 'web_search'} <= {r['search_type'] for r in result['results']}
+        assert result['retrieval_path']['web'] == 'used'
+
+        expected_triage = stand_in_chatbot.triage.triage('chest pain radiating to left arm').as_dict()
+        assert responses['/v1/triage'] == (200, expected_triage)
+        assert responses['/ready'][0] == 200 and responses['/ready'][1]['startup_timings']['total'] > 0
+        status, health = responses['/healthz']
+        assert status == 200 and health['status'] == 'ok' and health['in_flight'] == 0
+        assert all(status == 400 and 'error' in body for status, body in responses['invalid'])
+
+    def test_not_ready_until_warmup_finishes(self, stand_in_chatbot):
+        """Test that model-backed endpoints return 503 until warm-up completes, while triage keeps working"""
+        app = create_app(stand_in_chatbot)
+
+        async def scenario(client):
+            before = [(await client.get('/ready')).status,
+                      (await client.post('/v1/respond', json={'query': 'chest pain'})).status,
+                      (await client.post('/v1/triage', json={'query': 'chest pain'})).status]
+            stand_in_chatbot.start_warmup('data/Assignment-Data-Base.xlsx')
+            while (await client.get('/ready')).status != 200:
+                await asyncio.sleep(0.05)
+            after = (await client.post('/v1/respond', json={'query': 'chest pain'})).status
+            return before, after
+
+        before, after = _serve(app, scenario)
+        assert before == [503, 503, 200]
+        assert after == 200
+
+    def test_timeouts_and_concurrency_limit(self, stand_in_chatbot):
+        """Test that slow calls time out with 504 and requests over the limit are rejected with 503"""
+        stand_in_chatbot.initialize('data/Assignment-Data-Base.xlsx')
+        stand_in_chatbot.model = StandInGenerativeModel(latency=0.6)
+        app = create_app(stand_in_chatbot, max_concurrency=1, max_queue=1, request_timeout=0.3)
+
+        async def scenario(client):
+            requests = [client.post('/v1/respond', json={'query': f'chest pain {i}'}) for i in range(3)]
+            statuses = sorted([response.status for response in await asyncio.gather(*requests)])
+            health = await (await client.get('/healthz')).json()
+            # Timed-out calls hold their slots until the worker threads finish.
+            stand_in_chatbot.model = StandInGenerativeModel(latency=0.0)
+            await asyncio.sleep(1.2)
+            recovered = await client.post('/v1/respond', json={'query': 'chest pain'})
+            return statuses, health, recovered.status
+
+        statuses, health, recovered = _serve(app, scenario)
+        assert statuses == [503, 504, 504]
+        assert health['rejected'] == 1 and health['timed_out'] == 2
+        assert recovered == 200
+
+    def test_workers_share_one_prebuilt_index(self):
+        """Test that several worker processes serve one port from a single index built by the parent"""
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+
+        # The documented .env settings: in-memory Qdrant, which workers cannot share.
+        env = {**os.environ, 'HF_HUB_OFFLINE': '1', 'VECTOR_INDEX_BACKEND': 'qdrant', 'QDRANT_URL': ''}
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'src.server', '--stand-ins', '--workers', '2', '--port', str(port),
+             '--llm-latency', '0', '--web-latency', '0'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+        def get(path):
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=5) as response:
+                    return response.status, json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                return e.code, json.loads(e.read())
+
+        try:
+            ready = {}
+            deadline = time.monotonic() + 60
+            while len(ready) < 2 and time.monotonic() < deadline:
+                try:
+                    status, body = get('/ready')
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.2)
+                    continue
+                if status == 200:
+                    ready[body['pid']] = body['index']
+            assert len(ready) == 2, "Both workers should become ready"
+            for index in ready.values():
+                assert index['unchanged'] == 60 and index['added'] == index['updated'] == 0, \
+                    "Workers should re-open the parent's saved index without encoding the corpus"
+
+            request = urllib.request.Request(f'http://127.0.0.1:{port}/v1/respond', method='POST',
+                                             data=json.dumps({'query': 'low blood sugar and sweating'}).encode(),
+                                             headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=10) as response:
+                assert json.loads(response.read())['triage']['condition'] == 'diabetes'
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
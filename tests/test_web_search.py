@@ -0,0 +1,152 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.web_search import CircuitBreaker, SerperWebSearch, WebSearchError
+
+
+SERPER_RESPONSE = {
+    'organic': [
+        {'title': 'Hypoglycemia first aid', 'snippet': 'Give 15 g of fast sugar.', 'link': 'https://example.org/hypo'}
+    ]
+}
+
+
+class StandInSerper:
+    """Local HTTP server that replays a scripted sequence of Serper status codes"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.requests = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stand_in.requests.append(json.loads(body))
+                status = stand_in.statuses.pop(0) if stand_in.statuses else 200
+                payload = json.dumps(SERPER_RESPONSE if status == 200 else {'error': 'busy'}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/search"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def serper_key(monkeypatch):
+    monkeypatch.setenv('SERPER_API_KEY', 'test-key')
+
+
+class TestSerperWebSearch:
+
+    def test_retries_transient_errors(self, serper_key):
+        """Test that 429/5xx responses are retried with backoff before succeeding"""
+        stand_in = StandInSerper([503, 429])
+        try:
+            search = SerperWebSearch(base_url=stand_in.url, backoff_base=0.01)
+            results = search.search_medical_query("low blood sugar")
+        finally:
+            stand_in.close()
+
+        assert len(stand_in.requests) == 3
+        assert results[0]['title'] == 'Hypoglycemia first aid'
+        assert search.circuit_breaker.state == 'closed'
+
+    def test_circuit_breaker_stops_calls_after_repeated_failures(self, serper_key):
+        """Test that the breaker opens after repeated failures and skips the network"""
+        stand_in = StandInSerper([500] * 10)
+        breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+        try:
+            search = SerperWebSearch(base_url=stand_in.url, max_retries=1, backoff_base=0.01,
+                                     circuit_breaker=breaker)
+            for _ in range(2):
+                with pytest.raises(WebSearchError):
+                    search.search_medical_query("chest pain")
+
+            calls_before = len(stand_in.requests)
+            with pytest.raises(WebSearchError, match="circuit breaker is open"):
+                search.search_medical_query("chest pain")
+        finally:
+            stand_in.close()
+
+        assert calls_before == 4
+        assert len(stand_in.requests) == calls_before, "Open breaker must not call Serper"
+        assert breaker.state == 'open'
+
+    def test_unexpected_request_errors_release_half_open_trial(self, serper_key):
+        """Test that a trial call failing with a non-network RequestException re-opens the breaker instead of wedging it"""
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+        search = SerperWebSearch(base_url='http://127.0.0.1:9/search', circuit_breaker=breaker)
+
+        def broken_post(*args, **kwargs):
+            raise requests.exceptions.ChunkedEncodingError("connection broken mid-body")
+
+        search.session.post = broken_post
+        with pytest.raises(WebSearchError):
+            search.search_medical_query("chest pain")
+        assert breaker.state == 'open'
+
+        time.sleep(0.06)
+        with pytest.raises(WebSearchError, match="connection broken"):
+            search.search_medical_query("chest pain")
+        assert breaker.state == 'open', "The failed trial should re-open the breaker"
+
+        time.sleep(0.06)
+        assert breaker.allow(), "A new trial call must be allowed after the next cool-off"
+
+    def test_deadline_bounds_retries_and_backoff(self, serper_key):
+        """Test that retries stop once the caller's deadline has passed instead of each getting the full timeout"""
+        stand_in = StandInSerper([503] * 10)
+        try:
+            search = SerperWebSearch(base_url=stand_in.url, max_retries=5)
+            search._backoff = lambda attempt, retry_after=None: 0.2
+            start = time.perf_counter()
+            with pytest.raises(WebSearchError, match="after 3 attempts"):
+                search.search_medical_query("chest pain", timeout=10, deadline=start + 0.5)
+            elapsed = time.perf_counter() - start
+        finally:
+            stand_in.close()
+
+        assert len(stand_in.requests) == 3
+        assert elapsed < 0.5, "No backoff should sleep past the deadline"
+
+    def test_results_cached_in_memory_and_on_disk(self, serper_key, tmp_path):
+        """Test that repeated queries skip the network, including after a restart"""
+        stand_in = StandInSerper([])
+        cache_path = str(tmp_path / 'web.sqlite')
+        try:
+            search = SerperWebSearch(base_url=stand_in.url, cache_ttl=60, cache_path=cache_path)
+            first = search.search_with_medical_keywords("shaky and sweating", 'diabetes')
+            second = search.search_with_medical_keywords("shaky and sweating", 'diabetes')
+
+            restarted = SerperWebSearch(base_url=stand_in.url, cache_ttl=60, cache_path=cache_path)
+            third = restarted.search_with_medical_keywords("shaky and sweating", 'diabetes')
+        finally:
+            stand_in.close()
+
+        assert len(stand_in.requests) == 1
+        assert first == second == third
+        assert search.cache_stats()['memory_hits'] == 1
+        assert restarted.cache_stats()['disk_hits'] == 1